@@ -1,117 +1,1437 @@
+import argparse
+import bisect
 import cloudscraper
+import hashlib
+import json
+import math
+import os
+import queue
 import sqlite3
+import threading
 import time
 import random
-from datetime import datetime
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from cloudscraper.exceptions import CloudflareException
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 from tqdm import tqdm
 from bs4 import BeautifulSoup
+from lxml import etree
 
 # --- CONFIGURAÇÕES ---
-MAIN_SITEMAP_URL = "https://www.alexandrepavao.com/sitemap.xml"
+STORE_URL = "https://www.alexandrepavao.com"
+MAIN_SITEMAP_URL = f"{STORE_URL}/sitemap.xml"
 DB_NAME = "monitoramento_pavao.db"
 
-# Inicializa o scraper
-scraper = cloudscraper.create_scraper()
+# Modo de coleta: "sequencial" (padrão, um produto por vez) ou "concorrente"
+MODO_COLETA = "sequencial"
+MAX_WORKERS = 4                 # Teto de requisições simultâneas no modo concorrente (ajustado por AIMD)
+REQUISICOES_POR_SEGUNDO = 2.0   # Teto global de requisições ao host no modo concorrente
+AMOSTRA_ROTATIVA = 0.05         # Fração dos produtos sem mudança no lastmod re-coletada a cada execução incremental
+IDADE_MAXIMA_DIAS = 7.0         # Modo agendado: nenhum produto fica mais que isso sem nova verificação
+PROBABILIDADE_ALVO = 0.5        # Modo agendado: re-coleta quando a chance estimada de o produto ter mudado chega a isso
+PESO_VOLATIL = 2.0              # Modo agendado: multiplica a taxa de mudança de produtos em promoção ou esgotados
+LOTE_ESCRITA = 200              # Produtos por transação de escrita no banco
+LOTE_INTERVALO = 5.0            # Segundos até a escrita gravar um lote incompleto
+FILA_POR_WORKER = 4             # Itens por worker em cada fila entre os estágios da coleta
+SITEMAPS_PARALELOS = 4          # Sub-sitemaps baixados ao mesmo tempo na descoberta de produtos
+CATALOGO_LIMITE = 250           # Produtos por página no /products.json (máximo aceito pela Shopify)
+MAX_TENTATIVAS = 3              # Rodadas de repescagem dos erros transitórios no fim da execução
+BACKOFF_BASE = 5.0              # Espera (s) antes da 1ª repescagem; dobra a cada rodada, com jitter
+PAUSA_PADRAO = 30.0             # Pausa (s) após 429/503/desafio sem cabeçalho Retry-After
+PAUSA_MAXIMA = 300.0            # Teto para a pausa pedida pelo servidor
+CACHE_MAX_ENTRADAS = 100_000    # URLs mantidas no cache de respostas (as menos acessadas saem primeiro)
+ARQUIVO_DIR = "arquivo_parquet" # Histórico em Parquet particionado por mês (--exportar-parquet, requer pyarrow)
+SHARDS_DIR = "shards"           # Bancos parciais das coletas divididas (--shard i/N), até a junção
+DELTAS_DIR = "data"             # Deltas por execução em NDJSON + zstd (--deltas, requer zstandard)
+
+# Limitador global de requisições (definido em main() no modo concorrente)
+rate_limiter = None
+# Controle adaptativo de concorrência e pausas (definido em main())
+controller = None
+# Validadores (ETag, Last-Modified, hash) do último JSON de cada produto (carregado em main())
+response_cache = {}
+
+# Status que indicam sobrecarga/erro temporário do servidor: valem nova tentativa
+STATUS_TRANSITORIOS = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+
+# --- 0. CONTROLE DE TAXA ---
+class TokenBucket:
+    """
+    Limitador de taxa compartilhado entre threads (token bucket).
+    Libera no máximo `rate` requisições por segundo, com rajadas de até `capacity`.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveController:
+    """
+    Controle de concorrência AIMD. Sobe o limite de requisições simultâneas em +1 a cada
+    `limite` respostas saudáveis (2xx/3xx com latência perto da melhor observada) e corta pela
+    metade em 429/503 ou desafio do Cloudflare, pausando todos os workers pelo Retry-After.
+    """
+    def __init__(self, minimo, maximo, inicial=None):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.limite = inicial or minimo
+        self.em_voo = 0
+        self.sucessos = 0
+        self.latencia_base = None
+        self.pausa_ate = 0.0
+        self.ultima_reducao = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                espera = self.pausa_ate - time.monotonic()
+                if espera > 0:
+                    self.cond.wait(espera)
+                elif self.em_voo < self.limite:
+                    self.em_voo += 1
+                    return
+                else:
+                    self.cond.wait()
+
+    def release(self, latencia, status, bloqueado=False, retry_after=None):
+        with self.cond:
+            self.em_voo -= 1
+            agora = time.monotonic()
+            if bloqueado:
+                # Uma redução por rajada de bloqueios, não uma por resposta
+                if agora - self.ultima_reducao > 1.0:
+                    self.limite = max(self.minimo, self.limite // 2)
+                    self.ultima_reducao = agora
+                    self.sucessos = 0
+                pausa = PAUSA_PADRAO if retry_after is None else retry_after
+                self.pausa_ate = max(self.pausa_ate, agora + min(pausa, PAUSA_MAXIMA))
+            elif status is not None and 200 <= status < 400:
+                self.latencia_base = latencia if self.latencia_base is None else min(self.latencia_base, latencia)
+                if latencia <= 2 * self.latencia_base + 0.05:
+                    self.sucessos += 1
+                    if self.sucessos >= self.limite:
+                        self.limite = min(self.maximo, self.limite + 1)
+                        self.sucessos = 0
+            self.cond.notify_all()
+
+class SessionPool:
+    """
+    Pool de sessões cloudscraper, uma por requisição simultânea. A primeira sessão (semente)
+    resolve o desafio do Cloudflare; as demais só são criadas depois que ela responde e herdam
+    o User-Agent, a suíte TLS e o mesmo cookie jar (cf_clearance), em vez de resolver o desafio
+    de novo. Cada sessão mantém suas conexões keep-alive com o host.
+    """
+    def __init__(self, tamanho):
+        self.tamanho = max(1, tamanho)
+        self.semente = self._configurar(cloudscraper.create_scraper())
+        self.livres = [self.semente]
+        self.criadas = 1
+        self.aquecido = False
+        self.cond = threading.Condition()
+
+    def _configurar(self, sessao):
+        # Uma conexão por requisição em curso, mais as dos sitemaps ainda sendo lidos em
+        # streaming (a sessão volta ao pool antes de o corpo da resposta terminar)
+        for adapter in sessao.adapters.values():
+            adapter.init_poolmanager(4, 1 + math.ceil(SITEMAPS_PARALELOS / self.tamanho))
+        return sessao
+
+    def _clonar(self):
+        sessao = cloudscraper.create_scraper(sess=self.semente, cipherSuite=self.semente.cipherSuite)
+        # Cookie jar compartilhado (thread-safe): uma liberação nova vale para todas as sessões
+        sessao.cookies = self.semente.cookies
+        sessao.headers = self.semente.headers.copy()
+        return self._configurar(sessao)
+
+    @contextmanager
+    def session(self):
+        with self.cond:
+            while True:
+                if self.livres:
+                    sessao = self.livres.pop()
+                    break
+                if self.aquecido and self.criadas < self.tamanho:
+                    self.criadas += 1
+                    sessao = None
+                    break
+                self.cond.wait()
+        if sessao is None:
+            sessao = self._clonar()
+        try:
+            yield sessao
+        finally:
+            with self.cond:
+                self.livres.append(sessao)
+                self.aquecido = True
+                self.cond.notify()
+
+# Sessões HTTP (redimensionado em main() para o número de workers)
+sessions = SessionPool(1)
+
+def parse_retry_after(valor):
+    """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos de espera."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def is_blocked(response):
+    """429/503, ou 403 do Cloudflare (desafio que o cloudscraper não resolveu)."""
+    if response.status_code in (429, 503):
+        return True
+    return response.status_code == 403 and (
+        response.headers.get('cf-mitigated') == 'challenge'
+        or 'cloudflare' in response.headers.get('Server', '').lower()
+    )
+
+def http_get(url, **kwargs):
+    """
+    Ponto único de saída HTTP. Respeita o controle de concorrência e as pausas pedidas pelo
+    servidor, espera um token do limitador de taxa (se ativo) e informa o resultado ao controle
+    e às métricas da execução. Respostas em streaming têm os bytes contados por quem as lê.
+    """
+    if controller is not None:
+        controller.acquire()
+    status, bloqueado, retry_after, erro, tamanho = None, False, None, None, 0
+    inicio = time.monotonic()
+    try:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+            inicio = time.monotonic()
+        with sessions.session() as sessao:
+            response = sessao.get(url, **kwargs)
+        status = response.status_code
+        if not kwargs.get('stream'):
+            tamanho = response.raw.tell()
+        if is_blocked(response):
+            bloqueado = True
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        return response
+    except Exception as e:
+        bloqueado = isinstance(e, CloudflareException)
+        erro = type(e).__name__
+        raise
+    finally:
+        latencia = time.monotonic() - inicio
+        if controller is not None:
+            controller.release(latencia, status, bloqueado, retry_after)
+        metrics.record_request(latencia, status, erro, tamanho)
+
+# --- 0b. MÉTRICAS ---
+class RunMetrics:
+    """
+    Telemetria de uma execução, alimentada por todas as threads: tempo de parede por fase,
+    histograma de latência das requisições, contagem de status HTTP e de exceções, resultado
+    de cada produto (método de verificação ou tipo de falha), bytes recebidos e a profundidade
+    das filas entre os estágios da coleta.
+    """
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # Limites (s) do histograma
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.fases = {}
+        self.latencias = [0] * (len(self.BUCKETS) + 1)
+        self.soma_latencia = 0.0
+        self.status = {}
+        self.erros = {}
+        self.produtos = {}
+        self.bytes = 0
+        self.filas = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, nome):
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(nome, time.monotonic() - inicio)
+
+    def add_phase(self, nome, segundos):
+        with self.lock:
+            self.fases[nome] = self.fases.get(nome, 0.0) + segundos
+
+    def record_request(self, latencia, status=None, erro=None, tamanho=0):
+        with self.lock:
+            self.latencias[bisect.bisect_left(self.BUCKETS, latencia)] += 1
+            self.soma_latencia += latencia
+            if status is not None:
+                self.status[status] = self.status.get(status, 0) + 1
+            if erro:
+                self.erros[erro] = self.erros.get(erro, 0) + 1
+            self.bytes += tamanho
+
+    def add_bytes(self, tamanho):
+        with self.lock:
+            self.bytes += tamanho
+
+    def record_queues(self, profundidades):
+        """Amostra a profundidade de cada fila ({nome: itens}); o resumo traz média e máximo."""
+        with self.lock:
+            for nome, itens in profundidades.items():
+                soma, amostras, maximo = self.filas.get(nome, (0, 0, 0))
+                self.filas[nome] = (soma + itens, amostras + 1, max(maximo, itens))
+
+    def record_product(self, result):
+        """Conta o resultado de um produto: método de verificação, INALTERADO (cache) ou tipo de falha."""
+        if result and "error" not in result:
+            chave = "INALTERADO" if result.get('unchanged') else result['method']
+        elif result and 'status' in result:
+            chave = "FALHA_REDE" if result['status'] is None else f"FALHA_HTTP_{result['status']}"
+        else:
+            chave = "FALHA_DADOS"
+        with self.lock:
+            self.produtos[chave] = self.produtos.get(chave, 0) + 1
+
+    def summary(self):
+        with self.lock:
+            requisicoes = sum(self.latencias)
+            return {
+                "duracao_s": round(time.monotonic() - self.inicio, 3),
+                "fases_s": {fase: round(segundos, 3) for fase, segundos in self.fases.items()},
+                "requisicoes": requisicoes,
+                "erros_requisicao": sum(self.erros.values()) + sum(n for s, n in self.status.items() if s >= 400),
+                "latencia": {
+                    "limites_s": list(self.BUCKETS),
+                    "contagens": list(self.latencias),
+                    "soma_s": round(self.soma_latencia, 3),
+                    "media_s": round(self.soma_latencia / requisicoes, 4) if requisicoes else None,
+                },
+                "status": {str(s): n for s, n in sorted(self.status.items())},
+                "excecoes": dict(self.erros),
+                "produtos": dict(self.produtos),
+                "bytes": self.bytes,
+                "filas": {
+                    nome: {"media": round(soma / amostras, 1), "max": maximo}
+                    for nome, (soma, amostras, maximo) in self.filas.items()
+                },
+            }
+
+# Métricas da execução corrente (recriadas em main())
+metrics = RunMetrics()
+
+def save_run_metrics(conn, run, resumo):
+    """Grava o resumo da execução em `run_metrics` (uma linha por processo do coletor)."""
+    fases, produtos = resumo['fases_s'], resumo['produtos']
+    with conn:
+        conn.execute('''
+            INSERT INTO run_metrics (
+                execucao_id, data_coleta, fim, duracao_s, descoberta_s, coleta_s, escrita_s,
+                requisicoes, erros_requisicao, bytes, produtos_json, produtos_html, produtos_inalterados,
+                produtos_falha, detalhes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            run.id, run.timestamp, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            resumo['duracao_s'], fases.get('descoberta'), fases.get('coleta'), fases.get('escrita'),
+            resumo['requisicoes'], resumo['erros_requisicao'], resumo['bytes'],
+            produtos.get('JSON', 0), produtos.get('HTML_CHECK', 0), produtos.get('INALTERADO', 0),
+            sum(n for chave, n in produtos.items() if chave.startswith('FALHA')),
+            json.dumps(resumo),
+        ))
+
+def write_metrics_json(path, resumo):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(resumo, f, indent=2, ensure_ascii=False)
+
+def write_metrics_prometheus(path, resumo):
+    """
+    Exporta o resumo no formato texto do Prometheus (para o textfile collector do
+    node_exporter). Escreve num arquivo temporário e renomeia, como o collector espera.
+    """
+    linhas = [
+        "# TYPE pavao_coleta_duracao_segundos gauge",
+        f"pavao_coleta_duracao_segundos {resumo['duracao_s']}",
+        "# TYPE pavao_coleta_fase_segundos gauge",
+        *(f'pavao_coleta_fase_segundos{{fase="{fase}"}} {s}' for fase, s in resumo['fases_s'].items()),
+        "# TYPE pavao_requisicao_latencia_segundos histogram",
+    ]
+    acumulado = 0
+    for limite, contagem in zip(resumo['latencia']['limites_s'] + ["+Inf"], resumo['latencia']['contagens']):
+        acumulado += contagem
+        linhas.append(f'pavao_requisicao_latencia_segundos_bucket{{le="{limite}"}} {acumulado}')
+    linhas += [
+        f"pavao_requisicao_latencia_segundos_sum {resumo['latencia']['soma_s']}",
+        f"pavao_requisicao_latencia_segundos_count {resumo['requisicoes']}",
+        "# TYPE pavao_respostas_total counter",
+        *(f'pavao_respostas_total{{status="{s}"}} {n}' for s, n in resumo['status'].items()),
+        "# TYPE pavao_excecoes_total counter",
+        *(f'pavao_excecoes_total{{classe="{classe}"}} {n}' for classe, n in resumo['excecoes'].items()),
+        "# TYPE pavao_produtos_total counter",
+        *(f'pavao_produtos_total{{resultado="{chave}"}} {n}' for chave, n in resumo['produtos'].items()),
+        "# TYPE pavao_bytes_recebidos_total counter",
+        f"pavao_bytes_recebidos_total {resumo['bytes']}",
+        "# TYPE pavao_fila_profundidade gauge",
+        *(f'pavao_fila_profundidade{{fila="{nome}",estatistica="{estatistica}"}} {valor}'
+          for nome, fila in resumo.get('filas', {}).items() for estatistica, valor in fila.items()),
+        "# TYPE pavao_coleta_ultima_execucao_timestamp_segundos gauge",
+        f"pavao_coleta_ultima_execucao_timestamp_segundos {int(time.time())}",
+    ]
+    temporario = f"{path}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write("\n".join(linhas) + "\n")
+    os.replace(temporario, path)
 
 # --- 1. BANCO DE DADOS ---
-def setup_database():
-    conn = sqlite3.connect(DB_NAME)
+# Esquema normalizado: `produtos` guarda os atributos descritivos (uma linha por URL) e
+# `observacoes` só ganha linha quando preço, promoção ou disponibilidade mudam.
+# `historico_precos` virou uma view de compatibilidade para o dashboard.
+HISTORICO_VIEW = '''
+    CREATE VIEW IF NOT EXISTS historico_precos AS
+    SELECT o.id, o.data_coleta, p.produto_nome, p.sku, p.categoria, p.url, p.imagem_url, p.tags,
+           o.preco_original, o.preco_atual, o.em_promocao, o.disponivel, p.variante_id, o.metodo_verificacao
+    FROM observacoes o
+    JOIN produtos p ON p.id = o.produto_id
+    UNION ALL
+    -- Estado vigente na última verificação, quando ela é posterior à última mudança
+    SELECT NULL, p.ultima_coleta, p.produto_nome, p.sku, p.categoria, p.url, p.imagem_url, p.tags,
+           o.preco_original, o.preco_atual, o.em_promocao, o.disponivel, p.variante_id, o.metodo_verificacao
+    FROM produtos p
+    JOIN observacoes o ON o.id = (SELECT MAX(id) FROM observacoes WHERE produto_id = p.id)
+    WHERE p.ultima_coleta > o.data_coleta
+'''
+
+def setup_database(caminho=None):
+    # Durante a coleta a conexão passa para a thread de escrita (a única que grava)
+    conn = sqlite3.connect(caminho or DB_NAME, check_same_thread=False)
+    # WAL: o dashboard consegue ler enquanto o coletor escreve
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     cursor = conn.cursor()
+    # Verificado antes da migração do legado, que já cria as tabelas (inclusive change_events)
+    sem_eventos = not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'change_events'").fetchone()
+    legado = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'historico_precos'").fetchone()
+    if legado and legado[0] == 'table':
+        migrate_legacy_history(conn)
+
+    create_tables(cursor)
+    create_search_index(cursor)
+    cursor.execute(HISTORICO_VIEW)
+    # Último <lastmod> visto no sitemap para cada URL (base do modo incremental)
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS historico_precos (
+        CREATE TABLE IF NOT EXISTS sitemap_lastmod (
+            url TEXT PRIMARY KEY,
+            lastmod TEXT,
+            ultima_coleta DATETIME
+        )
+    ''')
+    conn.commit()
+    seed_latest_state(conn)
+    seed_crawl_stats(conn)
+    if sem_eventos:
+        with conn:
+            derive_change_events(conn)
+    return conn
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produtos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data_coleta DATETIME,
+            url TEXT NOT NULL UNIQUE,
             produto_nome TEXT,
             sku TEXT,
             categoria TEXT,
-            url TEXT,
             imagem_url TEXT,
             tags TEXT,
+            variante_id TEXT,
+            primeira_coleta DATETIME,
+            ultima_coleta DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS observacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produto_id INTEGER NOT NULL REFERENCES produtos(id),
+            data_coleta DATETIME,
             preco_original REAL,
             preco_atual REAL,
             em_promocao BOOLEAN,
             disponivel BOOLEAN,
-            variante_id TEXT,
             metodo_verificacao TEXT
         )
     ''')
+    # Eventos de mudança detectados na ingestão (alertas do dashboard): troca de preço, entrada
+    # e saída de estoque, início e fim de promoção, com o preço antes e depois da mudança
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produto_id INTEGER NOT NULL REFERENCES produtos(id),
+            data_coleta DATETIME,
+            tipo TEXT NOT NULL,
+            preco_anterior REAL,
+            preco_novo REAL,
+            variacao_pct REAL
+        )
+    ''')
+    # Tabelas materializadas para o dashboard, mantidas na mesma transação das gravações:
+    # último estado de cada SKU e contagens diárias por categoria/disponibilidade/promoção
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estado_atual (
+            sku TEXT PRIMARY KEY,
+            url TEXT,
+            produto_nome TEXT,
+            categoria TEXT,
+            imagem_url TEXT,
+            preco_original REAL,
+            preco_atual REAL,
+            em_promocao BOOLEAN,
+            disponivel BOOLEAN,
+            data_coleta DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agregados_diarios (
+            dia DATE,
+            categoria TEXT,
+            disponivel BOOLEAN,
+            em_promocao BOOLEAN,
+            total_produtos INTEGER,
+            soma_preco REAL,
+            soma_desconto_pct REAL,
+            PRIMARY KEY (dia, categoria, disponivel, em_promocao)
+        )
+    ''')
+    # Cache HTTP do JSON de cada produto: validadores para requisição condicional e hash do
+    # corpo. Só guarda produtos cujo estoque veio do próprio JSON (metodo 'JSON')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_respostas (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            hash TEXT NOT NULL,
+            acessado_em DATETIME
+        )
+    ''')
+    # Verificações e mudanças de cada URL, para o modo agendado estimar com que frequência ela muda
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estatisticas_coleta (
+            url TEXT PRIMARY KEY,
+            verificacoes INTEGER,
+            mudancas INTEGER,
+            primeira_verificacao DATETIME,
+            ultima_verificacao DATETIME,
+            ultima_mudanca DATETIME
+        )
+    ''')
+    # Telemetria de cada processo do coletor (uma execução retomada pode ter mais de uma linha)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            execucao_id INTEGER,
+            data_coleta DATETIME,
+            fim DATETIME,
+            duracao_s REAL,
+            descoberta_s REAL,
+            coleta_s REAL,
+            escrita_s REAL,
+            requisicoes INTEGER,
+            erros_requisicao INTEGER,
+            bytes INTEGER,
+            produtos_json INTEGER,
+            produtos_html INTEGER,
+            produtos_inalterados INTEGER,
+            produtos_falha INTEGER,
+            detalhes TEXT
+        )
+    ''')
+    # Execuções de coleta e a fronteira de URLs de cada uma (status por URL), para retomar
+    # uma execução interrompida só com o que faltou
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS execucoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data_coleta DATETIME,
+            status TEXT,
+            descoberta_concluida BOOLEAN DEFAULT 0,
+            fim DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fronteira (
+            execucao_id INTEGER NOT NULL REFERENCES execucoes(id),
+            url TEXT NOT NULL,
+            lastmod TEXT,
+            status TEXT,
+            erro TEXT,
+            PRIMARY KEY (execucao_id, url)
+        )
+    ''')
+    create_indexes(cursor)
+
+def create_indexes(cursor):
+    """
+    Índices usados pelo dashboard (ordenação/agrupamento por produto e data, filtro por categoria).
+    Criados também em bancos já existentes, a cada setup_database.
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_observacoes_produto")  # substituído pelo índice composto
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_observacoes_produto_data ON observacoes (produto_id, data_coleta)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_observacoes_data ON observacoes (data_coleta)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_produtos_sku ON produtos (sku)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_produtos_categoria ON produtos (categoria)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_estado_atual_categoria ON estado_atual (categoria)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_events_data ON change_events (data_coleta)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_events_tipo_data ON change_events (tipo, data_coleta)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_events_produto ON change_events (produto_id, data_coleta)")
+
+# Busca de produtos do dashboard: índice FTS5 com o conteúdo em `produtos` (external content),
+# mantido por gatilhos em toda gravação de produtos (coleta, junção das partes, reconstrução)
+BUSCA_GATILHOS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS produtos_busca_insercao AFTER INSERT ON produtos BEGIN
+        INSERT INTO busca_produtos (rowid, produto_nome, tags, sku, categoria)
+        VALUES (new.id, new.produto_nome, new.tags, new.sku, new.categoria);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS produtos_busca_remocao AFTER DELETE ON produtos BEGIN
+        INSERT INTO busca_produtos (busca_produtos, rowid, produto_nome, tags, sku, categoria)
+        VALUES ('delete', old.id, old.produto_nome, old.tags, old.sku, old.categoria);
+    END
+    ''',
+    # Toda coleta regrava os atributos (upsert): o índice só muda quando algum texto muda
+    '''
+    CREATE TRIGGER IF NOT EXISTS produtos_busca_alteracao AFTER UPDATE OF produto_nome, tags, sku, categoria ON produtos
+    WHEN old.produto_nome IS NOT new.produto_nome OR old.tags IS NOT new.tags
+      OR old.sku IS NOT new.sku OR old.categoria IS NOT new.categoria
+    BEGIN
+        INSERT INTO busca_produtos (busca_produtos, rowid, produto_nome, tags, sku, categoria)
+        VALUES ('delete', old.id, old.produto_nome, old.tags, old.sku, old.categoria);
+        INSERT INTO busca_produtos (rowid, produto_nome, tags, sku, categoria)
+        VALUES (new.id, new.produto_nome, new.tags, new.sku, new.categoria);
+    END
+    ''',
+]
+
+def create_search_index(cursor):
+    """
+    Cria o índice FTS5 `busca_produtos` (nome, tags, sku e categoria; sem acentos e com índice
+    de prefixos de 2 e 3 letras) e os gatilhos que o mantêm em dia. Na criação, indexa os
+    produtos já existentes. Retorna False se o SQLite não tiver FTS5 (a busca fica indisponível).
+    """
+    novo = not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'busca_produtos'").fetchone()
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS busca_produtos USING fts5(
+                produto_nome, tags, sku, categoria,
+                content='produtos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Busca de produtos indisponível (SQLite sem FTS5?): {e}")
+        return False
+    for gatilho in BUSCA_GATILHOS:
+        cursor.execute(gatilho)
+    if novo:
+        cursor.execute("INSERT INTO busca_produtos (busca_produtos) VALUES ('rebuild')")
+    return True
+
+def migrate_legacy_history(conn):
+    """
+    Converte a tabela larga `historico_precos` (uma linha por produto por coleta) no esquema
+    normalizado, mantendo só a primeira observação de cada produto e as que mudaram algo.
+    Tudo numa transação: ou migra inteiro, ou o banco fica como estava.
+    """
+    print("Migrando historico_precos para o esquema produtos/observacoes...", flush=True)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    cursor.execute("ALTER TABLE historico_precos RENAME TO historico_precos_legado")
+    create_tables(cursor)
+    cursor.execute('''
+        INSERT INTO produtos (url, produto_nome, sku, categoria, imagem_url, tags, variante_id, primeira_coleta, ultima_coleta)
+        SELECT h.url, h.produto_nome, h.sku, h.categoria, h.imagem_url, h.tags, h.variante_id, r.primeira, r.ultima
+        FROM historico_precos_legado h
+        JOIN (
+            SELECT MAX(id) AS id, MIN(data_coleta) AS primeira, MAX(data_coleta) AS ultima
+            FROM historico_precos_legado
+            WHERE url IS NOT NULL
+            GROUP BY url
+        ) r ON r.id = h.id
+    ''')
+    cursor.execute('''
+        INSERT INTO observacoes (produto_id, data_coleta, preco_original, preco_atual, em_promocao, disponivel, metodo_verificacao)
+        SELECT p.id, h.data_coleta, h.preco_original, h.preco_atual, h.em_promocao, h.disponivel, h.metodo_verificacao
+        FROM (
+            SELECT *,
+                   ROW_NUMBER() OVER w AS n,
+                   LAG(preco_original) OVER w AS ant_original,
+                   LAG(preco_atual) OVER w AS ant_atual,
+                   LAG(em_promocao) OVER w AS ant_promo,
+                   LAG(disponivel) OVER w AS ant_disponivel
+            FROM historico_precos_legado
+            WHERE url IS NOT NULL
+            WINDOW w AS (PARTITION BY url ORDER BY data_coleta, id)
+        ) h
+        JOIN produtos p ON p.url = h.url
+        WHERE h.n = 1
+           OR h.preco_original IS NOT h.ant_original
+           OR h.preco_atual IS NOT h.ant_atual
+           OR h.em_promocao IS NOT h.ant_promo
+           OR h.disponivel IS NOT h.ant_disponivel
+        ORDER BY h.data_coleta, h.id
+    ''')
+    migradas = cursor.rowcount
+    # Cada coleta do legado verificou todo o catálogo: vira uma execução concluída (sem hora de
+    # fim), para que estatisticas_coleta conte as verificações e não só as mudanças
+    cursor.execute('''
+        INSERT INTO execucoes (data_coleta, status, descoberta_concluida)
+        SELECT DISTINCT data_coleta, 'concluida', 1
+        FROM historico_precos_legado
+        WHERE data_coleta IS NOT NULL
+        ORDER BY data_coleta
+    ''')
+    total = cursor.execute("SELECT COUNT(*) FROM historico_precos_legado").fetchone()[0]
+    cursor.execute("DROP TABLE historico_precos_legado")
     conn.commit()
-    return conn
+    cursor.execute("VACUUM")
+    print(f"Migração concluída: {total} registros -> {migradas} observações.", flush=True)
+
+def load_last_states(conn):
+    """
+    Estado mais recente (preços, promoção, disponibilidade) de cada URL, para detectar mudanças.
+    """
+    rows = conn.execute('''
+        SELECT p.url, o.preco_original, o.preco_atual, o.em_promocao, o.disponivel
+        FROM produtos p
+        JOIN observacoes o ON o.id = (SELECT MAX(id) FROM observacoes WHERE produto_id = p.id)
+    ''')
+    return {url: tuple(state) for url, *state in rows}
+
+def load_response_cache(conn):
+    """Validadores e hash do último JSON de cada produto: {url: (etag, last_modified, hash)}."""
+    rows = conn.execute("SELECT url, etag, last_modified, hash FROM cache_respostas")
+    return {url: tuple(validadores) for url, *validadores in rows}
+
+def evict_response_cache(conn):
+    """Mantém só as CACHE_MAX_ENTRADAS URLs acessadas mais recentemente."""
+    conn.execute('''
+        DELETE FROM cache_respostas WHERE url NOT IN (
+            SELECT url FROM cache_respostas ORDER BY acessado_em DESC LIMIT ?
+        )
+    ''', (CACHE_MAX_ENTRADAS,))
+
+def product_state(result):
+    return (result['original'], result['current'], int(bool(result['is_promo'])), int(bool(result['available'])))
+
+def seed_latest_state(conn):
+    """
+    Preenche estado_atual (e os agregados do último dia) a partir do histórico em bancos
+    que ainda não tinham as tabelas materializadas.
+    """
+    if conn.execute("SELECT 1 FROM estado_atual LIMIT 1").fetchone():
+        return
+    if not conn.execute("SELECT 1 FROM observacoes LIMIT 1").fetchone():
+        return
+    with conn:
+        # Ordenado pela última verificação: em SKUs repetidos, vence o mais recente
+        conn.execute('''
+            INSERT OR REPLACE INTO estado_atual
+            (sku, url, produto_nome, categoria, imagem_url, preco_original, preco_atual, em_promocao, disponivel, data_coleta)
+            SELECT p.sku, p.url, p.produto_nome, p.categoria, p.imagem_url,
+                   o.preco_original, o.preco_atual, o.em_promocao, o.disponivel, p.ultima_coleta
+            FROM produtos p
+            JOIN observacoes o ON o.id = (SELECT MAX(id) FROM observacoes WHERE produto_id = p.id)
+            ORDER BY p.ultima_coleta
+        ''')
+        ultimo_dia = conn.execute("SELECT MAX(date(data_coleta)) FROM estado_atual").fetchone()[0]
+        refresh_daily_aggregates(conn, ultimo_dia)
+
+# Eventos de mudança (change_events): price_change, stock_in/stock_out e promo_start/promo_end
+INSERT_EVENTO_SQL = '''
+    INSERT INTO change_events (produto_id, data_coleta, tipo, preco_anterior, preco_novo, variacao_pct)
+    VALUES ((SELECT id FROM produtos WHERE url = ?), ?, ?, ?, ?, ?)
+'''
+
+def price_variation(anterior, novo):
+    if anterior is None or novo is None or anterior <= 0:
+        return None
+    return (novo - anterior) / anterior * 100
+
+def detect_changes(anterior, atual):
+    """
+    Eventos entre dois estados de product_state (preco_original, preco_atual, em_promocao,
+    disponivel), na ordem de change_events: [(tipo, preco_anterior, preco_novo, variacao_pct)].
+    Sem estado anterior (produto novo) não há evento.
+    """
+    if anterior is None:
+        return []
+    _, preco_anterior, promo_anterior, disponivel_anterior = anterior
+    _, preco, promo, disponivel = atual
+    precos = (preco_anterior, preco, price_variation(preco_anterior, preco))
+    eventos = []
+    if preco != preco_anterior:
+        eventos.append(('price_change', *precos))
+    if disponivel != disponivel_anterior:
+        eventos.append(('stock_in' if disponivel else 'stock_out', *precos))
+    if promo != promo_anterior:
+        eventos.append(('promo_start' if promo else 'promo_end', *precos))
+    return eventos
+
+def derive_change_events(conn):
+    """
+    Preenche change_events a partir das observações (cada uma comparada à anterior do mesmo
+    produto), com as mesmas regras de detect_changes. Usada em bancos anteriores à tabela e na
+    reconstrução a partir dos deltas. Não abre transação própria.
+    """
+    conn.execute('''
+        INSERT INTO change_events (produto_id, data_coleta, tipo, preco_anterior, preco_novo, variacao_pct)
+        WITH t AS (
+            SELECT id, produto_id, data_coleta, preco_atual, em_promocao, disponivel,
+                   LAG(preco_atual) OVER w AS ant_atual,
+                   LAG(em_promocao) OVER w AS ant_promo,
+                   LAG(disponivel) OVER w AS ant_disponivel,
+                   ROW_NUMBER() OVER w AS n
+            FROM observacoes
+            WINDOW w AS (PARTITION BY produto_id ORDER BY id)
+        ), eventos AS (
+            SELECT id, 0 AS ordem, 'price_change' AS tipo FROM t WHERE n > 1 AND preco_atual IS NOT ant_atual
+            UNION ALL
+            SELECT id, 1, CASE WHEN disponivel THEN 'stock_in' ELSE 'stock_out' END
+            FROM t WHERE n > 1 AND disponivel IS NOT ant_disponivel
+            UNION ALL
+            SELECT id, 2, CASE WHEN em_promocao THEN 'promo_start' ELSE 'promo_end' END
+            FROM t WHERE n > 1 AND em_promocao IS NOT ant_promo
+        )
+        SELECT t.produto_id, t.data_coleta, e.tipo, t.ant_atual, t.preco_atual,
+               CASE WHEN t.ant_atual > 0 THEN (t.preco_atual - t.ant_atual) / t.ant_atual * 100 END
+        FROM eventos e
+        JOIN t ON t.id = e.id
+        ORDER BY e.id, e.ordem
+    ''')
+
+def seed_crawl_stats(conn):
+    """
+    Preenche estatisticas_coleta a partir do histórico em bancos que ainda não tinham a tabela.
+    Conta como verificação cada execução concluída entre a primeira e a última coleta do
+    produto (o que supõe que toda execução o verificou) e como mudança cada observação após a primeira.
+    """
+    if conn.execute("SELECT 1 FROM estatisticas_coleta LIMIT 1").fetchone():
+        return
+    with conn:
+        conn.execute('''
+            INSERT INTO estatisticas_coleta
+            (url, verificacoes, mudancas, primeira_verificacao, ultima_verificacao, ultima_mudanca)
+            SELECT url, MAX(execucoes, mudancas + 1), mudancas, primeira_coleta, ultima_coleta,
+                   CASE WHEN mudancas > 0 THEN ultima_mudanca END
+            FROM (
+                SELECT p.url, p.primeira_coleta, p.ultima_coleta,
+                       (SELECT COUNT(*) FROM execucoes e WHERE e.status = 'concluida'
+                        AND e.data_coleta BETWEEN p.primeira_coleta AND p.ultima_coleta) AS execucoes,
+                       (SELECT COUNT(*) - 1 FROM observacoes o WHERE o.produto_id = p.id) AS mudancas,
+                       (SELECT MAX(data_coleta) FROM observacoes o WHERE o.produto_id = p.id) AS ultima_mudanca
+                FROM produtos p
+                WHERE EXISTS (SELECT 1 FROM observacoes o WHERE o.produto_id = p.id)
+            )
+        ''')
+
+UPSERT_ESTADO_SQL = '''
+    INSERT OR REPLACE INTO estado_atual
+    (sku, url, produto_nome, categoria, imagem_url, preco_original, preco_atual, em_promocao, disponivel, data_coleta)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def update_latest_state(conn, timestamp, results):
+    """
+    Atualiza estado_atual com um lote de resultados e recalcula os agregados do dia
+    das categorias afetadas (as novas e as anteriores, caso um produto mude de categoria).
+    Deve rodar dentro da transação do lote.
+    """
+    skus = [result['sku'] for result in results]
+    categorias = {result['categoria'] for result in results}
+    categorias.update(row[0] for row in conn.execute(
+        f"SELECT DISTINCT categoria FROM estado_atual WHERE sku IN ({', '.join('?' * len(skus))})", skus
+    ))
+
+    conn.executemany(UPSERT_ESTADO_SQL, [(
+        result['sku'],
+        result['url'],
+        result['title'],
+        result['categoria'],
+        result['imagem_url'],
+        *product_state(result),
+        timestamp
+    ) for result in results])
+    refresh_daily_aggregates(conn, timestamp[:10], categorias)
+
+def refresh_daily_aggregates(conn, dia, categorias=None):
+    """
+    Recalcula agregados_diarios do dia a partir de estado_atual (todas as categorias se
+    `categorias` for None). É O(catálogo), nunca O(histórico).
+    """
+    filtro, params = "", []
+    if categorias is not None:
+        categorias = list(categorias)
+        if not categorias:
+            return
+        filtro = f"WHERE categoria IN ({', '.join('?' * len(categorias))})"
+        params = categorias
+
+    conn.execute(f"DELETE FROM agregados_diarios WHERE dia = ? {filtro.replace('WHERE', 'AND')}", (dia, *params))
+    conn.execute(f'''
+        INSERT INTO agregados_diarios
+        (dia, categoria, disponivel, em_promocao, total_produtos, soma_preco, soma_desconto_pct)
+        SELECT ?, categoria, disponivel, em_promocao, COUNT(*), SUM(preco_atual),
+               SUM(CASE WHEN em_promocao = 1 AND preco_original > 0
+                        THEN (preco_original - preco_atual) / preco_original * 100 ELSE 0 END)
+        FROM estado_atual
+        {filtro}
+        GROUP BY categoria, disponivel, em_promocao
+    ''', (dia, *params))
+
+# --- 1b. ARQUIVO PARQUET ---
+# Colunas de historico_precos exportadas. Só as de texto com poucos valores distintos vão em
+# dicionário (viram categóricas no dashboard); as demais, como texto simples
+COLUNAS_ARQUIVO = [
+    'data_coleta', 'produto_nome', 'sku', 'categoria', 'url', 'imagem_url', 'tags',
+    'preco_original', 'preco_atual', 'em_promocao', 'disponivel', 'variante_id', 'metodo_verificacao'
+]
+COLUNAS_NUMERICAS = {'preco_original': 'float64', 'preco_atual': 'float64', 'em_promocao': 'int8', 'disponivel': 'int8'}
+COLUNAS_DICIONARIO = {'categoria', 'metodo_verificacao'}
+
+def export_parquet(conn, pasta=ARQUIVO_DIR):
+    """
+    Exporta as observações (mudanças) de execuções concluídas para Parquet particionado por
+    mês (`pasta/mes=AAAA-MM/historico.parquet`, zstd). Só os meses com observações novas desde
+    a última exportação são reescritos. O manifesto (`_manifesto.json`) registra até que
+    `data_coleta` o arquivo vai: o dashboard lê dele as observações até esse ponto e do SQLite
+    o restante (observações posteriores e o estado vigente de cada produto).
+    Retorna quantas linhas foram gravadas.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("Exportação Parquet requer o pyarrow (pip install pyarrow).")
+        return 0
+
+    manifesto_path = os.path.join(pasta, "_manifesto.json")
+    try:
+        with open(manifesto_path, encoding="utf-8") as f:
+            anterior = json.load(f)['ate']
+    except (OSError, ValueError, KeyError):
+        anterior = None
+
+    # Execuções não concluídas ficam de fora; as ainda em andamento (que podem ser retomadas)
+    # também seguram o `ate`, para que as suas observações entrem numa exportação futura
+    incompletas = "data_coleta NOT IN (SELECT data_coleta FROM execucoes WHERE status <> 'concluida')"
+    ate = conn.execute(
+        f"SELECT MAX(data_coleta) FROM observacoes WHERE {incompletas} AND data_coleta < "
+        "COALESCE((SELECT MIN(data_coleta) FROM execucoes WHERE status = 'em_andamento'), '9999-12-31')"
+    ).fetchone()[0]
+    if ate is None or ate == anterior:
+        print("Arquivo Parquet já está em dia.")
+        return 0
+
+    # Meses a (re)escrever: do mês da exportação anterior em diante
+    meses = [
+        mes for (mes,) in conn.execute(
+            "SELECT DISTINCT substr(data_coleta, 1, 7) FROM observacoes WHERE data_coleta >= ? AND data_coleta <= ? "
+            "ORDER BY 1", ((anterior or "")[:7], ate)
+        )
+    ]
+    total = 0
+    for mes in meses:
+        rows = conn.execute(f'''
+            SELECT {', '.join(COLUNAS_ARQUIVO)} FROM historico_precos
+            WHERE id IS NOT NULL AND data_coleta >= ? AND data_coleta < ? AND data_coleta <= ? AND {incompletas}
+            ORDER BY data_coleta
+        ''', (mes, f"{mes}-32", ate)).fetchall()
+        colunas = {}
+        for nome, valores in zip(COLUNAS_ARQUIVO, zip(*rows)):
+            if nome in COLUNAS_NUMERICAS:
+                colunas[nome] = pa.array(valores, type=COLUNAS_NUMERICAS[nome])
+            else:
+                colunas[nome] = pa.array([None if v is None else str(v) for v in valores], type=pa.string())
+                if nome in COLUNAS_DICIONARIO:
+                    colunas[nome] = colunas[nome].dictionary_encode()
+        table = pa.table(colunas)
+        destino = os.path.join(pasta, f"mes={mes}")
+        os.makedirs(destino, exist_ok=True)
+        temporario = os.path.join(destino, ".historico.parquet.tmp")  # Prefixo "." é ignorado pelos leitores
+        pq.write_table(table, temporario, compression="zstd")
+        os.replace(temporario, os.path.join(destino, "historico.parquet"))
+        total += len(rows)
+        print(f"Arquivo Parquet: {mes} com {len(rows)} observações.")
+
+    # O manifesto vem por último: leitores nunca veem um `ate` além do que já está gravado
+    with open(f"{manifesto_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"ate": ate, "exportado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(f"{manifesto_path}.tmp", manifesto_path)
+    return total
+
+# --- 1c. DELTAS POR EXECUÇÃO (NDJSON + ZSTD) ---
+# Formato versionável do histórico: cada execução vira um arquivo pequeno e imutável
+# (DELTAS_DIR/AAAA/MM/DD/run-HHMMSS.ndjson.zst), com uma linha JSON por registro, ordenadas:
+#   execucao       timestamp, fim da execução e `formato` do arquivo
+#   produto        produto novo ou com atributos (nome, sku, categoria...) alterados
+#   observacao     mudança de preço, promoção ou disponibilidade
+#   nao_verificado produto verificado desde o delta anterior que esta execução não verificou
+#   verificado     produto que volta a ser verificado sem linha 'produto' ou 'observacao'
+#   metricas       linha de run_metrics
+# Só as transições vão no arquivo: um produto conta como verificado em toda execução até uma
+# linha 'nao_verificado' e volta a contar na primeira linha 'produto', 'observacao' ou
+# 'verificado'. (No formato 1, 'nao_verificado' listava todos os não verificados da execução.)
+# --reconstruir refaz o banco inteiro a partir desses arquivos.
+TIPOS_DELTA = ['execucao', 'produto', 'observacao', 'nao_verificado', 'verificado', 'metricas']
+FORMATO_DELTA = 2
+COLUNAS_PRODUTO = ['produto_nome', 'sku', 'categoria', 'imagem_url', 'tags', 'variante_id']
+COLUNAS_ESTADO = ['preco_original', 'preco_atual', 'em_promocao', 'disponivel', 'metodo_verificacao']
+
+def import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        print("Deltas em .ndjson.zst requerem o zstandard (pip install zstandard).")
+        return None
+    return zstandard
+
+def delta_path(timestamp, pasta=DELTAS_DIR):
+    data = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+    return os.path.join(pasta, data.strftime("%Y"), data.strftime("%m"), data.strftime("%d"),
+                        f"run-{data.strftime('%H%M%S')}.ndjson.zst")
+
+def delta_timestamp(caminho):
+    """Timestamp da execução de um delta, lido do caminho (inverso de delta_path)."""
+    partes = os.path.normpath(caminho).split(os.sep)[-4:]
+    return datetime.strptime("/".join(partes), "%Y/%m/%d/run-%H%M%S.ndjson.zst").strftime("%Y-%m-%d %H:%M:%S")
+
+def previous_delta_timestamp(timestamp, pasta=DELTAS_DIR):
+    """Timestamp do último delta em `pasta` anterior a `timestamp` (None se não houver)."""
+    anteriores = [ts for ts in map(delta_timestamp, iter_delta_files(pasta)) if ts < timestamp]
+    return anteriores[-1] if anteriores else None
+
+def load_product_attributes(conn):
+    """
+    Atributos descritivos e última verificação de cada URL antes da execução, para o delta
+    registrar só os atributos que mudarem e os produtos que voltarem a ser verificados.
+    """
+    rows = conn.execute(f"SELECT url, ultima_coleta, {', '.join(COLUNAS_PRODUTO)} FROM produtos")
+    return {url: (tuple(atributos), ultima_coleta) for url, ultima_coleta, *atributos in rows}
+
+def export_delta(conn, timestamp, atributos=None, pasta=DELTAS_DIR, anterior=None):
+    """
+    Grava o delta da execução `timestamp`. `atributos` é o retrato de load_product_attributes
+    tirado antes da execução; sem ele, só os produtos novos ganham linha 'produto' e nenhum
+    ganha linha 'verificado'. `anterior` é o timestamp do delta anterior (procurado em `pasta`
+    se não vier): quem foi verificado desde ele e não nesta execução ganha 'nao_verificado'.
+    Retorna o caminho gravado (ou None sem o zstandard).
+    """
+    zstandard = import_zstd()
+    if zstandard is None:
+        return None
+
+    anterior = anterior or previous_delta_timestamp(timestamp, pasta)
+    execucao = conn.execute(
+        "SELECT id, fim FROM execucoes WHERE data_coleta = ? AND status = 'concluida' ORDER BY id DESC LIMIT 1",
+        (timestamp,)
+    ).fetchone()
+    linhas = [{
+        "tipo": "execucao", "data_coleta": timestamp, "fim": execucao[1] if execucao else None,
+        "formato": FORMATO_DELTA,
+    }]
+    for url, primeira_coleta, *valores in conn.execute(
+        f"SELECT url, primeira_coleta, {', '.join(COLUNAS_PRODUTO)} FROM produtos "
+        "WHERE ultima_coleta = ? OR primeira_coleta = ? ORDER BY url",
+        (timestamp, timestamp)
+    ):
+        if primeira_coleta == timestamp or (atributos is not None and atributos.get(url, ((), None))[0] != tuple(valores)):
+            linhas.append({"tipo": "produto", "url": url, **dict(zip(COLUNAS_PRODUTO, valores))})
+    linhas.extend(
+        {"tipo": "observacao", "url": url, **dict(zip(COLUNAS_ESTADO, valores))}
+        for url, *valores in conn.execute(f'''
+            SELECT p.url, {', '.join(f"o.{coluna}" for coluna in COLUNAS_ESTADO)}
+            FROM observacoes o
+            JOIN produtos p ON p.id = o.produto_id
+            WHERE o.data_coleta = ?
+            ORDER BY p.url
+        ''', (timestamp,))
+    )
+    linhas.extend(
+        {"tipo": "nao_verificado", "url": url} for (url,) in conn.execute(
+            "SELECT url FROM produtos WHERE primeira_coleta <= ? AND ultima_coleta < ? AND ultima_coleta >= ? "
+            "ORDER BY url",
+            (timestamp, timestamp, anterior or "")
+        )
+    )
+    if atributos is not None:
+        # Verificado agora, mas não desde o delta anterior (na retomada de uma execução interrompida,
+        # os já verificados antes dela também entram: a linha a mais não muda nada na reconstrução)
+        registrados = {linha['url'] for linha in linhas if 'url' in linha}
+        linhas.extend(
+            {"tipo": "verificado", "url": url} for (url,) in conn.execute(
+                "SELECT url FROM produtos WHERE ultima_coleta = ? ORDER BY url", (timestamp,)
+            )
+            if url not in registrados and not (anterior or "") <= (atributos.get(url, ((), None))[1] or "") < timestamp
+        )
+    if execucao:
+        metricas = conn.execute("SELECT * FROM run_metrics WHERE execucao_id = ? ORDER BY id", (execucao[0],))
+        colunas = [col[0] for col in metricas.description]
+        for row in metricas:
+            linha = dict(zip(colunas, row))
+            for coluna in ('id', 'execucao_id', 'data_coleta'):
+                del linha[coluna]
+            linhas.append({"tipo": "metricas", **linha})
+
+    corpo = "".join(json.dumps(linha, ensure_ascii=False, sort_keys=True) + "\n" for linha in linhas)
+    destino = delta_path(timestamp, pasta)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(f"{destino}.tmp", "wb") as f:
+        f.write(zstandard.ZstdCompressor(level=19).compress(corpo.encode("utf-8")))
+    os.replace(f"{destino}.tmp", destino)
+    return destino
+
+# Coletas do histórico de um banco: execuções concluídas e timestamps com observações ou verificações
+COLETAS_HISTORICO_SQL = '''
+    SELECT data_coleta FROM execucoes WHERE status = 'concluida'
+    UNION SELECT data_coleta FROM observacoes
+    UNION SELECT ultima_coleta FROM produtos
+    EXCEPT SELECT data_coleta FROM execucoes WHERE status <> 'concluida'
+    ORDER BY 1
+'''
+
+def export_history_deltas(conn, pasta=DELTAS_DIR):
+    """
+    Gera os deltas de todo o histórico já gravado no banco (migração para o modo de deltas):
+    um arquivo por execução concluída ou timestamp com observações. Como o banco não guarda
+    os atributos antigos dos produtos, cada produto entra com os atributos atuais.
+    Retorna quantos arquivos foram gravados.
+    """
+    timestamps = [ts for (ts,) in conn.execute(COLETAS_HISTORICO_SQL) if ts]
+    anterior = None
+    for timestamp in tqdm(timestamps, unit="exec"):
+        if export_delta(conn, timestamp, pasta=pasta, anterior=anterior) is None:
+            return 0
+        anterior = timestamp
+    print(f"Deltas: {len(timestamps)} execuções gravadas em {pasta}/.")
+    return len(timestamps)
+
+def iter_delta_files(pasta=DELTAS_DIR):
+    """Arquivos de delta em ordem cronológica (os caminhos AAAA/MM/DD/run-HHMMSS ordenam pela data)."""
+    arquivos = []
+    for raiz, _, nomes in os.walk(pasta):
+        arquivos.extend(os.path.join(raiz, nome) for nome in nomes if nome.endswith(".ndjson.zst"))
+    return sorted(arquivos)
+
+# Estado da coleta que os deltas não guardam (só serve ao próprio coletor)
+TABELAS_COLETA = ['sitemap_lastmod', 'cache_respostas', 'estatisticas_coleta']
+
+def history_timestamps(caminho):
+    """
+    Coletas do histórico do banco em `caminho` (as que --exportar-deltas gravaria), sem
+    migrá-lo nem alterá-lo. Lista vazia se o banco não existir.
+    """
+    if not os.path.exists(caminho):
+        return []
+    with closing(sqlite3.connect(caminho)) as conn:
+        tabelas = {nome for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'observacoes' in tabelas:
+            query = COLETAS_HISTORICO_SQL
+        elif 'historico_precos' in tabelas:  # Formato antigo, ainda não migrado
+            query = "SELECT DISTINCT data_coleta FROM historico_precos ORDER BY 1"
+        else:
+            return []
+        return [ts for (ts,) in conn.execute(query) if ts]
+
+def copy_crawl_state(conn, origem):
+    """Substitui as tabelas de TABELAS_COLETA do banco de `conn` pelas do banco `origem` (as que ele tiver)."""
+    conn.execute("ATTACH DATABASE ? AS origem", (origem,))
+    try:
+        existentes = {nome for (nome,) in conn.execute("SELECT name FROM origem.sqlite_master WHERE type = 'table'")}
+        with conn:
+            for tabela in TABELAS_COLETA:
+                if tabela in existentes:
+                    colunas = ', '.join(col[1] for col in conn.execute(f"PRAGMA main.table_info({tabela})"))
+                    conn.execute(f"DELETE FROM main.{tabela}")
+                    conn.execute(f"INSERT INTO main.{tabela} ({colunas}) SELECT {colunas} FROM origem.{tabela}")
+    finally:
+        conn.execute("DETACH DATABASE origem")
+
+def rebuild_from_deltas(pasta=DELTAS_DIR, destino=None):
+    """
+    Refaz o banco a partir dos deltas, numa cópia temporária que substitui `destino` (DB_NAME)
+    só no fim. Reproduz produtos, observações, execuções, run_metrics, estado_atual, change_events
+    e os agregados de cada dia.
+
+    Recusa (retorna None, sem tocar em nada) se o banco existente tiver coletas que nenhum delta
+    cobre, já que elas se perderiam. Se ele estiver em dia com o último delta, o estado da coleta
+    (TABELAS_COLETA) vem dele; senão os caches começam vazios e as estatísticas de coleta são
+    estimadas a partir do histórico, como em bancos antigos.
+    Retorna quantos arquivos foram aplicados.
+    """
+    zstandard = import_zstd()
+    if zstandard is None:
+        return 0
+    destino = destino or DB_NAME
+    arquivos = iter_delta_files(pasta)
+    cobertas = {delta_timestamp(arquivo) for arquivo in arquivos}
+    existentes = history_timestamps(destino)
+    faltando = [timestamp for timestamp in existentes if timestamp not in cobertas]
+    if faltando:
+        print(f"⚠️ {destino} tem {len(faltando)} coletas sem delta em {pasta}/ ({faltando[0]} a {faltando[-1]}): "
+              "a reconstrução as apagaria. Gere os deltas do histórico com --exportar-deltas antes de reconstruir.")
+        return None
+    if not arquivos:
+        print(f"Nenhum delta em {pasta}/.")
+        return 0
+
+    temporario = f"{destino}.reconstruindo"
+    remove_db(temporario)
+    conn = setup_database(temporario)
+    conn.execute("CREATE TEMP TABLE nao_verificados (url TEXT PRIMARY KEY)")
+    descompressor = zstandard.ZstdDecompressor()
+    with conn:
+        for i, arquivo in enumerate(tqdm(arquivos, unit="exec")):
+            with open(arquivo, "rb") as f:
+                linhas = [json.loads(linha) for linha in descompressor.decompress(f.read()).splitlines()]
+            por_tipo = {tipo: [linha for linha in linhas if linha['tipo'] == tipo] for tipo in TIPOS_DELTA}
+            execucao = por_tipo['execucao'][0]
+            timestamp = execucao['data_coleta']
+
+            run_id = conn.execute(
+                "INSERT INTO execucoes (data_coleta, status, descoberta_concluida, fim) VALUES (?, 'concluida', 1, ?)",
+                (timestamp, execucao['fim'])
+            ).lastrowid
+            conn.executemany(UPSERT_PRODUTO_SQL, [
+                (linha['url'], *(linha[coluna] for coluna in COLUNAS_PRODUTO), timestamp, timestamp)
+                for linha in por_tipo['produto']
+            ])
+            conn.executemany(INSERT_OBSERVACAO_SQL, [
+                (linha['url'], timestamp, *(linha[coluna] for coluna in COLUNAS_ESTADO))
+                for linha in por_tipo['observacao']
+            ])
+            # Formato 1: a lista completa dos não verificados; a partir do 2, só as transições
+            if execucao.get('formato', 1) < 2:
+                conn.execute("DELETE FROM nao_verificados")
+            else:
+                conn.executemany("DELETE FROM nao_verificados WHERE url = ?", [
+                    (linha['url'],) for linha in por_tipo['produto'] + por_tipo['observacao'] + por_tipo['verificado']
+                ])
+            conn.executemany("INSERT OR IGNORE INTO nao_verificados VALUES (?)",
+                             [(linha['url'],) for linha in por_tipo['nao_verificado']])
+            conn.execute("UPDATE produtos SET ultima_coleta = ? WHERE url NOT IN (SELECT url FROM nao_verificados)",
+                         (timestamp,))
+            # estado_atual só muda para quem teve observação ou atributos novos
+            alterados = {linha['url'] for linha in por_tipo['produto'] + por_tipo['observacao']}
+            conn.executemany('''
+                INSERT OR REPLACE INTO estado_atual
+                (sku, url, produto_nome, categoria, imagem_url, preco_original, preco_atual, em_promocao, disponivel, data_coleta)
+                SELECT p.sku, p.url, p.produto_nome, p.categoria, p.imagem_url,
+                       o.preco_original, o.preco_atual, o.em_promocao, o.disponivel, p.ultima_coleta
+                FROM produtos p
+                JOIN observacoes o ON o.id = (SELECT MAX(id) FROM observacoes WHERE produto_id = p.id)
+                WHERE p.url = ?
+            ''', [(url,) for url in sorted(alterados)])
+            for linha in por_tipo['metricas']:
+                metricas = {k: v for k, v in linha.items() if k != 'tipo'}
+                metricas.update(execucao_id=run_id, data_coleta=timestamp)
+                conn.execute(
+                    f"INSERT INTO run_metrics ({', '.join(metricas)}) VALUES ({', '.join('?' * len(metricas))})",
+                    list(metricas.values())
+                )
+            # Agregados do dia com o estado ao fim da última execução dele
+            proximo = os.path.dirname(arquivos[i + 1]) if i + 1 < len(arquivos) else None
+            if proximo != os.path.dirname(arquivo):
+                refresh_daily_aggregates(conn, timestamp[:10])
+        conn.execute(
+            "UPDATE estado_atual SET data_coleta = (SELECT ultima_coleta FROM produtos p WHERE p.url = estado_atual.url)"
+        )
+        # Os eventos não vão nos deltas: saem das observações, comparadas em sequência
+        derive_change_events(conn)
+    seed_crawl_stats(conn)
+    # Um banco atrasado em relação aos deltas não cede o cache: os validadores dele dariam como
+    # inalterado um produto que mudou nas execuções que lhe faltam
+    if existentes and existentes[-1] == delta_timestamp(arquivos[-1]):
+        copy_crawl_state(conn, destino)
+        print(f"Estado da coleta ({', '.join(TABELAS_COLETA)}) mantido de {destino}.")
+    conn.close()
+
+    remove_db(destino)
+    os.replace(temporario, destino)
+    print(f"Banco {destino} reconstruído a partir de {len(arquivos)} deltas.")
+    return len(arquivos)
 
 # --- 2. CHECAGEM DE ESTOQUE EXTRA (VIA HTML) ---
+# Pista 1: Schema.org no JSON-LD, tolerante a espaços e a http/https
+AVAILABILITY_RE = re.compile(rb'"availability"\s*:\s*"https?://schema\.org/(\w+)"', re.IGNORECASE)
+DISPONIVEL_SCHEMA = {b'instock': True, b'limitedavailability': True, b'onlineonly': True, b'preorder': True,
+                     b'backorder': True, b'outofstock': False, b'soldout': False, b'discontinued': False}
+# Pista 2: botão de compra (submit) com "Esgotado"/"Sold out"
+ESGOTADO_RE = re.compile(rb'<button[^>]*type=["\']?submit[^>]*>(?:[^<]|<(?!/button))*?(?:esgotado|sold out)',
+                         re.IGNORECASE)
+SOBREPOSICAO = 1024  # Bytes re-examinados entre chunks, para pistas que caem na divisa
+
+def extract_availability(chunks):
+    """
+    Procura a disponibilidade num HTML recebido em pedaços (bytes) e para no primeiro sinal
+    conclusivo, sem baixar o resto da página. Retorna (disponivel, pista, bytes_lidos).
+    O parse completo com BeautifulSoup só acontece se nenhuma pista aparecer no texto.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        inicio = max(0, len(buffer) - SOBREPOSICAO)
+        buffer.extend(chunk)
+        for match in AVAILABILITY_RE.finditer(buffer, inicio):
+            disponivel = DISPONIVEL_SCHEMA.get(match.group(1).lower())
+            if disponivel is not None:
+                return disponivel, "schema", len(buffer)
+        if ESGOTADO_RE.search(buffer, inicio):
+            return False, "botao", len(buffer)
+
+    # Último recurso: parse completo dos botões de compra
+    soup = BeautifulSoup(bytes(buffer), 'html.parser')
+    buttons = soup.find_all('button', type='submit')
+    for btn in buttons:
+        if 'esgotado' in btn.text.lower() or 'sold out' in btn.text.lower():
+            return False, "parse", len(buffer)
+
+    # Se não achou "Esgotado" explícito, assume que tem (para evitar falsos negativos)
+    return True, "padrao", len(buffer)
+
 def check_html_availability(url):
     """
-    Se o JSON falhar, baixamos o HTML e procuramos a tag que o Google lê.
+    Se o JSON falhar, baixamos o HTML (em streaming) e procuramos a tag que o Google lê.
+    Retorna (disponivel, status). Sem resposta 200 (erro de rede, 429, 5xx, página de desafio)
+    a página não diz nada sobre o estoque: `disponivel` vem None, com o status (None se não
+    houve resposta).
     """
     try:
-        r = scraper.get(url, timeout=10)
-        html = r.text
-        
-        # Pista 1: Schema.org (Padrão Ouro)
-        if '"availability": "http://schema.org/InStock"' in html or '"availability":"http://schema.org/InStock"' in html:
-            return True
-        if '"availability": "http://schema.org/OutOfStock"' in html:
-            return False
-            
-        # Pista 2: Botão de Comprar
-        # Se encontrar texto "Esgotado" visível em botões chave
-        soup = BeautifulSoup(html, 'html.parser')
-        buttons = soup.find_all('button', type='submit')
-        for btn in buttons:
-            if 'esgotado' in btn.text.lower() or 'sold out' in btn.text.lower():
-                return False
-                
-        # Se não achou "Esgotado" explícito, assume que tem (para evitar falsos negativos)
-        return True 
-    except:
-        return False # Na dúvida, se der erro de conexão, marca falso
+        with http_get(url, timeout=10, stream=True) as r:
+            if r.status_code != 200:
+                return None, r.status_code
+            available, _, _ = extract_availability(r.iter_content(chunk_size=16384))
+            metrics.add_bytes(r.raw.tell())
+            return available, r.status_code
+    except Exception:
+        return None, None
 
 # --- 3. SITEMAPS E URLS (Padrão) ---
+def iter_sitemap(url):
+    """
+    Lê um sitemap em streaming (lxml iterparse) e gera (loc, lastmod) de cada <url>/<sitemap>
+    à medida que chegam, descartando os elementos já lidos: memória constante.
+    """
+    with http_get(url, timeout=10, stream=True) as response:
+        print(f"Status {url}: {response.status_code}", flush=True)
+        response.raw.decode_content = True
+        try:
+            for _, elem in etree.iterparse(response.raw, events=('end',), tag=('{*}url', '{*}sitemap')):
+                loc = elem.findtext('{*}loc')
+                lastmod = elem.findtext('{*}lastmod')
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+                if loc:
+                    yield loc.strip(), lastmod.strip() if lastmod else None
+        finally:
+            metrics.add_bytes(response.raw.tell())
+
 def get_product_sitemaps(main_url):
     try:
         print(f"Buscando sitemap principal: {main_url}", flush=True)
-        response = scraper.get(main_url, timeout=10)
-        print(f"Status sitemap principal: {response.status_code}", flush=True)
-        
-        soup = BeautifulSoup(response.content, 'xml')
-        sitemaps = []
-        for loc in soup.find_all('loc'):
-            url = loc.text.strip()
-            # Filtro mais abrangente para garantir que pega o sitemap de produtos
-            if 'products' in url:
-                sitemaps.append(url)
+        # Filtro mais abrangente para garantir que pega o sitemap de produtos
+        sitemaps = [url for url, _ in iter_sitemap(main_url) if 'products' in url]
         print(f"Sitemaps encontrados: {sitemaps}", flush=True)
         return sitemaps
     except Exception as e:
         print(f"Erro ao buscar sitemap principal: {e}", flush=True)
         return []
 
-def get_product_urls(sitemap_url):
+def iter_product_entries(sitemap_url):
+    """Gera (url, lastmod) dos produtos de um sitemap. lastmod é None quando ausente."""
+    print(f"Buscando URLs em: {sitemap_url}", flush=True)
+    total = 0
+    for url, lastmod in iter_sitemap(sitemap_url):
+        if '/products/' in url:
+            total += 1
+            yield url, lastmod
+    print(f"URLs encontradas em {sitemap_url}: {total}", flush=True)
+
+def get_product_entries(sitemap_url):
+    """
+    Retorna [(url, lastmod)] dos produtos de um sitemap. lastmod é None quando ausente.
+    """
     try:
-        print(f"Buscando URLs em: {sitemap_url}", flush=True)
-        response = scraper.get(sitemap_url, timeout=10)
-        soup = BeautifulSoup(response.content, 'xml')
-        urls = []
-        for loc in soup.find_all('loc'):
-            url = loc.text.strip()
-            if '/products/' in url:
-                urls.append(url)
-        print(f"URLs encontradas: {len(urls)}", flush=True)
-        return urls
+        return list(iter_product_entries(sitemap_url))
     except Exception as e:
         print(f"Erro ao buscar URLs do sitemap {sitemap_url}: {e}", flush=True)
         return []
 
+def get_product_urls(sitemap_url):
+    return [url for url, _ in get_product_entries(sitemap_url)]
+
+def discover_products(main_url, lastmods):
+    """
+    Gera as URLs de produto de todos os sub-sitemaps, sem repetição, à medida que são lidas.
+    Os sub-sitemaps são baixados em paralelo (SITEMAPS_PARALELOS) e o lastmod de cada URL
+    vai sendo registrado em `lastmods`. Como é um gerador, a coleta começa antes de a
+    descoberta terminar. O tempo até o fim da leitura do último sitemap (independente do ritmo
+    da coleta) entra nas métricas como 'descoberta'.
+    """
+    inicio = time.monotonic()
+    sitemaps = get_product_sitemaps(main_url)
+    if not sitemaps:
+        metrics.add_phase('descoberta', time.monotonic() - inicio)
+        return
+    fila = queue.Queue()
+    fim = object()
+    lidos_em = []
+
+    def ler(sitemap_url):
+        try:
+            for entry in iter_product_entries(sitemap_url):
+                fila.put(entry)
+        except Exception as e:
+            print(f"Erro ao buscar URLs do sitemap {sitemap_url}: {e}", flush=True)
+        finally:
+            lidos_em.append(time.monotonic())
+            fila.put(fim)
+
+    with ThreadPoolExecutor(max_workers=min(SITEMAPS_PARALELOS, len(sitemaps))) as executor:
+        for sitemap_url in sitemaps:
+            executor.submit(ler, sitemap_url)
+        restantes = len(sitemaps)
+        while restantes:
+            item = fila.get()
+            if item is fim:
+                restantes -= 1
+                continue
+            url, lastmod = item
+            if url in lastmods:
+                continue
+            lastmods[url] = lastmod
+            yield url
+    metrics.add_phase('descoberta', max(lidos_em) - inicio)
+
 # --- 4. EXTRAÇÃO DE DADOS INTELIGENTE ---
-def get_product_data(product_url):
-    json_url = f"{product_url}.json"
-    
+def parse_product(data, product_url):
+    """
+    Normaliza um produto Shopify (do JSON individual ou do /products.json) no formato salvo no banco.
+    """
     try:
-        response = scraper.get(json_url, timeout=15)
-        if response.status_code != 200: return {"error": f"Status {response.status_code}"}
-            
-        data = response.json().get('product')
-        if not data or not data.get('variants'): return {"error": "Dados inválidos"}
+        if not data or not data.get('variants'): return {"error": "Dados inválidos", "url": product_url}
             
         variant = data['variants'][0]
         
@@ -150,7 +1470,10 @@ def get_product_data(product_url):
         
         # 2. Se for None (JSON escondeu a info), vai pro HTML
         if available is None:
-            available = check_html_availability(product_url)
+            available, status = check_html_availability(product_url)
+            if available is None:
+                # Falha na página (transitória se rede, 429 ou 5xx): vai para a repescagem
+                return {"error": f"HTML status {status}", "url": product_url, "status": status}
             method = "HTML_CHECK"
             
         return {
@@ -169,66 +1492,993 @@ def get_product_data(product_url):
         }
         
     except Exception as e:
-        return {"error": str(e)}
+        return {"error": str(e), "url": product_url}
+
+def fetch_product(product_url):
+    """
+    Estágio de coleta: só a requisição do JSON do produto, condicional quando o JSON anterior
+    está no cache. A decodificação fica para normalize_product.
+    """
+    anterior = response_cache.get(product_url)
+    headers = {}
+    if anterior:
+        etag, last_modified, _ = anterior
+        if etag: headers['If-None-Match'] = etag
+        if last_modified: headers['If-Modified-Since'] = last_modified
+
+    try:
+        response = http_get(f"{product_url}.json", timeout=15, headers=headers)
+    except Exception as e:
+        # Falha de rede/timeout/desafio: transitória (status None), vai para a repescagem
+        return {"error": str(e), "url": product_url, "status": None}
+    return {"url": product_url, "response": response, "anterior": anterior}
+
+def normalize_product(item):
+    """
+    Estágio de normalização: 304 ou corpo com o mesmo hash do cache significam produto
+    inalterado, sem decodificar nem normalizar nada; senão decodifica o JSON e normaliza
+    (parse_product, que pode precisar da checagem de HTML). Itens vindos do catálogo em lote
+    (`catalogo`) já trazem o JSON do produto.
+    """
+    product_url = item['url']
+    if "error" in item:
+        return item
+    if "catalogo" in item:
+        return parse_product(item['catalogo'], product_url)
+
+    response, anterior = item['response'], item['anterior']
+    try:
+        if response.status_code == 304 and anterior:
+            return {"url": product_url, "unchanged": True, "cache": anterior}
+        if response.status_code != 200:
+            return {"error": f"Status {response.status_code}", "url": product_url, "status": response.status_code}
+        cache = (
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            hashlib.blake2b(response.content, digest_size=16).hexdigest(),
+        )
+        if anterior and anterior[2] == cache[2]:
+            return {"url": product_url, "unchanged": True, "cache": cache}
+        result = parse_product(response.json().get('product'), product_url)
+        if "error" not in result:
+            result['cache'] = cache
+        return result
+    except Exception as e:
+        return {"error": str(e), "url": product_url}
+
+def get_product_data(product_url):
+    return normalize_product(fetch_product(product_url))
+
+# --- 4b. CATÁLOGO EM LOTE (/products.json) ---
+def product_handle(url):
+    """Extrai o handle ('/products/<handle>') de uma URL de produto."""
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+def get_catalog_products(store_url):
+    """
+    Percorre /products.json página a página e devolve {handle: produto}.
+    Cada página traz até CATALOGO_LIMITE produtos com as mesmas variants/images do JSON individual.
+    """
+    catalogo = {}
+    page = 1
+    while True:
+        try:
+            response = http_get(f"{store_url}/products.json?limit={CATALOGO_LIMITE}&page={page}", timeout=30)
+            if response.status_code != 200:
+                print(f"Catálogo: status {response.status_code} na página {page}, interrompendo.", flush=True)
+                break
+            products = response.json().get('products', [])
+        except Exception as e:
+            print(f"Erro ao buscar página {page} do catálogo: {e}", flush=True)
+            break
+        if not products:
+            break
+        for product in products:
+            if product.get('handle'):
+                catalogo[product['handle']] = product
+        page += 1
+        if rate_limiter is None:
+            time.sleep(random.uniform(0.5, 1.0))
+    print(f"Catálogo: {len(catalogo)} produtos lidos do /products.json.", flush=True)
+    return catalogo
+
+# --- 5. COLETA EM PIPELINE (SEQUENCIAL / CONCORRENTE) ---
+# produtor (URLs) -> coleta (rede) -> normalização (JSON -> registro) -> escrita (banco)
+# Os estágios são threads ligadas por filas limitadas: quando um deles fica para trás, as filas
+# antes dele enchem e seguram os anteriores (back-pressure), e a memória não cresce com o
+# catálogo. A escrita é uma única thread, a única a gravar no banco durante a coleta, que grava
+# em lotes de LOTE_ESCRITA produtos ou a cada LOTE_INTERVALO segundos, o que vier antes.
+FIM = object()  # Marca de fim de fila
+
+class Pipeline:
+    """
+    Uma passada de coleta (a principal ou uma repescagem). `workers` threads de coleta, metade
+    disso de normalização (a checagem de HTML também é rede) e uma de escrita; o produtor é a
+    thread que chama process(). No modo sequencial, `pausa` é o intervalo (s, mín/máx) entre produtos.
+    A profundidade das filas vai para a barra de progresso e para as métricas da execução.
+    """
+    def __init__(self, run, workers, pausa=None):
+        self.run = run
+        self.workers = workers
+        self.normalizadores = max(1, workers // 2)
+        self.pausa = pausa
+        tamanho = workers * FILA_POR_WORKER
+        self.filas = {
+            'urls': queue.Queue(tamanho),
+            'respostas': queue.Queue(tamanho),
+            'escrita': queue.Queue(max(tamanho, LOTE_ESCRITA)),
+        }
+        self.pbar = None
+        self.salvos = 0
+        self.mudancas = 0
+        self.transitorios = []
+        self.erros = []
+        self.parar = threading.Event()
+
+    def depths(self):
+        return {nome: fila.qsize() for nome, fila in self.filas.items()}
+
+    # Chamados pela descoberta (persist_frontier): a fronteira também é gravada pela escrita
+    def register_pending(self, url, lastmod):
+        self.filas['escrita'].put(('pendente', (url, lastmod)))
+
+    def discovery_done(self, carregados):
+        self.filas['escrita'].put(('descoberta', carregados))
+
+    def process(self, urls, pbar, catalogo=None):
+        """
+        Roda a passada até o fim e retorna (salvos, mudancas, urls_com_erro_transitorio).
+        Com `catalogo` ({handle: produto}), os produtos resolvidos pelo catálogo em lote
+        pulam a coleta e vão direto para a normalização.
+        """
+        self.pbar = pbar
+        escritor = self._start(self._write)
+        normalizadores = [
+            self._start(self._stage, self.filas['respostas'], normalize_product, self.filas['escrita'], 'resultado')
+            for _ in range(self.normalizadores)
+        ]
+        coletores = [
+            self._start(self._stage, self.filas['urls'], self._fetch, self.filas['respostas'])
+            for _ in range(self.workers)
+        ]
+        self._produce(urls, catalogo)
+
+        for fila, threads in (('urls', coletores), ('respostas', normalizadores)):
+            for _ in threads:
+                self.filas[fila].put(FIM)
+            for thread in threads:
+                thread.join()
+        self.filas['escrita'].put(FIM)
+        escritor.join()
+        if self.erros:
+            raise self.erros[0]
+        return self.salvos, self.mudancas, self.transitorios
+
+    def _start(self, alvo, *args):
+        # daemon: um Ctrl+C no produtor encerra o processo (a execução fica para ser retomada)
+        thread = threading.Thread(target=alvo, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def _fail(self, erro):
+        self.erros.append(erro)
+        self.parar.set()
+
+    def _produce(self, urls, catalogo):
+        individuais = 0
+        try:
+            for url in urls:
+                if self.parar.is_set():
+                    break
+                data = catalogo.get(product_handle(url)) if catalogo else None
+                if data and data.get('variants') and data['variants'][0].get('available') is not None:
+                    self.filas['respostas'].put({"url": url, "catalogo": data})
+                else:
+                    individuais += 1
+                    self.filas['urls'].put(url)
+        except Exception as e:
+            self._fail(e)
+        if catalogo is not None and individuais:
+            tqdm.write(f"Catálogo: {individuais} produtos seguem para a coleta individual.")
+
+    def _fetch(self, url):
+        item = fetch_product(url)
+        if self.pausa:
+            time.sleep(random.uniform(*self.pausa))  # Delay para evitar bloqueio
+        return item
+
+    def _stage(self, entrada, funcao, saida, tipo=None):
+        """Laço de um estágio: consome `entrada` até o FIM e põe o resultado de `funcao` em `saida`."""
+        while True:
+            item = entrada.get()
+            if item is FIM:
+                return
+            if self.parar.is_set():
+                continue
+            try:
+                resultado = funcao(item)
+            except Exception as e:
+                self._fail(e)
+                continue
+            saida.put((tipo, resultado) if tipo else resultado)
+
+    def _write(self):
+        fila = self.filas['escrita']
+        lote, falhas, pendentes = [], [], []
+        prazo = None
+        while True:
+            try:
+                item = fila.get(timeout=None if prazo is None else max(0.0, prazo - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is FIM:
+                break
+            if item is not None and not self.parar.is_set():
+                tipo, valor = item
+                if tipo == 'pendente':
+                    pendentes.append(valor)
+                elif tipo == 'descoberta':
+                    # Tudo o que foi registrado antes vai junto com o fim da descoberta
+                    self._flush(lote, falhas, pendentes)
+                    lote, falhas, pendentes, prazo = [], [], [], None
+                    self._guard(finish_discovery, self.run, valor)
+                    continue
+                else:
+                    self._receive(valor, lote, falhas)
+                if prazo is None:
+                    prazo = time.monotonic() + LOTE_INTERVALO
+            if len(lote) + len(falhas) >= LOTE_ESCRITA or len(pendentes) >= LOTE_ESCRITA or (
+                prazo is not None and time.monotonic() >= prazo
+            ):
+                self._flush(lote, falhas, pendentes)
+                lote, falhas, pendentes, prazo = [], [], [], None
+        self._flush(lote, falhas, pendentes)
+
+    def _receive(self, result, lote, falhas):
+        metrics.record_product(result)
+        if result and "error" not in result:
+            lote.append(result)
+            self.salvos += 1
+        else:
+            falhas.append(result)
+            if is_transient(result):
+                self.transitorios.append(result['url'])
+
+        profundidades = self.depths()
+        metrics.record_queues(profundidades)
+        self.pbar.update(1)
+        if controller is not None and controller.maximo > 1:
+            profundidades['concorrencia'] = controller.limite
+        self.pbar.set_postfix(profundidades, refresh=False)
+
+    def _flush(self, lote, falhas, pendentes):
+        if (lote or falhas or pendentes) and not self.parar.is_set():
+            with metrics.phase('escrita'):
+                self.mudancas += self._guard(save_batch, self.run, lote, falhas, pendentes) or 0
+
+    def _guard(self, funcao, *args):
+        """Erro ao gravar para a passada inteira (os demais estágios só esvaziam as filas)."""
+        try:
+            return funcao(*args)
+        except Exception as e:
+            self._fail(e)
+
+# --- 5b. MODOS INCREMENTAL (LASTMOD) E AGENDADO (FREQUÊNCIA DE MUDANÇA) ---
+def plan_incremental(conn, urls, lastmods, carregados):
+    """
+    Filtra as URLs descobertas (gerador) para o modo incremental. Passam: URLs novas, sem
+    lastmod ou com lastmod diferente do último visto, mais ao final uma amostra rotativa
+    (as de coleta mais antiga) para pegar mudanças só de estoque, que não alteram o lastmod.
+    As demais vão para `carregados` e mantêm o último estado.
+    """
+    conhecidos = {
+        url: (lastmod, ultima_coleta)
+        for url, lastmod, ultima_coleta in conn.execute("SELECT url, lastmod, ultima_coleta FROM sitemap_lastmod")
+    }
+    inalterados = []
+    for url in urls:
+        lastmod = lastmods.get(url)
+        anterior = conhecidos.get(url)
+        if anterior is None or lastmod is None or anterior[0] != lastmod:
+            yield url
+        else:
+            inalterados.append(url)
+
+    inalterados.sort(key=lambda url: conhecidos[url][1] or "")
+    n_amostra = math.ceil(len(inalterados) * AMOSTRA_ROTATIVA)
+    carregados.extend(inalterados[n_amostra:])
+    tqdm.write(f"Modo incremental: {len(inalterados)} sem mudança no lastmod, {n_amostra} re-coletados por amostragem.")
+    yield from inalterados[:n_amostra]
+
+def change_rate(verificacoes, mudancas, primeira, ultima):
+    """
+    Mudanças por dia estimadas para uma URL a partir das verificações entre `primeira` e
+    `ultima` (datetimes). Usa o estimador de Cho e Garcia-Molina, que desconta as mudanças
+    que duas verificações seguidas não conseguem ver. None com menos de duas verificações.
+    """
+    intervalos = verificacoes - 1
+    dias = (ultima - primeira).total_seconds() / 86400
+    if intervalos < 1 or dias <= 0:
+        return None
+    mudancas = min(mudancas, intervalos)
+    return -math.log((intervalos - mudancas + 0.5) / (intervalos + 0.5)) * intervalos / dias
+
+def recrawl_priority(taxa, idade, volatil, idade_maxima=IDADE_MAXIMA_DIAS):
+    """
+    (prioridade, intervalo) de uma URL verificada há `idade` dias: a probabilidade de ter
+    mudado desde então e o intervalo, em dias, em que ela chega a PROBABILIDADE_ALVO (até
+    `idade_maxima`). Produtos em promoção ou esgotados (`volatil`) contam com a taxa
+    multiplicada por PESO_VOLATIL. Sem taxa estimada, prioridade máxima e intervalo zero.
+    """
+    if taxa is None:
+        return 1.0, 0.0
+    if volatil:
+        taxa *= PESO_VOLATIL
+    if taxa <= 0:
+        return 0.0, idade_maxima
+    return 1 - math.exp(-taxa * idade), min(idade_maxima, -math.log(1 - PROBABILIDADE_ALVO) / taxa)
+
+def plan_scheduled(run, urls, carregados, orcamento=None, idade_maxima=IDADE_MAXIMA_DIAS):
+    """
+    Filtra as URLs descobertas (gerador) para o modo agendado. Passam na hora as obrigatórias:
+    novas, com lastmod alterado no sitemap ou sem verificação há `idade_maxima` dias. Das
+    demais, as vencidas (idade >= intervalo de recrawl_priority) passam ao final da descoberta,
+    em ordem de prioridade, até completar o `orcamento` de produtos da execução (todas, sem
+    orçamento). As restantes vão para `carregados` e mantêm o último estado.
+    """
+    conn = run.conn
+    lastmods_vistos = dict(conn.execute("SELECT url, lastmod FROM sitemap_lastmod"))
+    estatisticas = {
+        url: tuple(valores) for url, *valores in
+        conn.execute("SELECT url, verificacoes, mudancas, primeira_verificacao, ultima_verificacao FROM estatisticas_coleta")
+    }
+    agora = datetime.fromisoformat(run.timestamp)
+    # Obrigatórias por serem novas ou terem lastmod alterado / por passarem da idade máxima
+    pelo_sitemap, pela_idade, vencidas, em_dia = 0, 0, [], []
+    for url in urls:
+        lastmod, anterior = run.lastmods.get(url), lastmods_vistos.get(url)
+        if url not in estatisticas or (lastmod is not None and anterior is not None and lastmod != anterior):
+            pelo_sitemap += 1
+            yield url
+            continue
+        verificacoes, mudancas, primeira, ultima = estatisticas[url]
+        ultima = datetime.fromisoformat(ultima)
+        idade = (agora - ultima).total_seconds() / 86400
+        if idade >= idade_maxima:
+            pela_idade += 1
+            yield url
+            continue
+        estado = run.last_states.get(url)
+        volatil = estado is not None and (estado[2] == 1 or estado[3] == 0)
+        taxa = change_rate(verificacoes, mudancas, datetime.fromisoformat(primeira), ultima)
+        prioridade, intervalo = recrawl_priority(taxa, idade, volatil, idade_maxima)
+        if idade >= intervalo:
+            vencidas.append((prioridade, idade, url))
+        else:
+            em_dia.append(url)
+
+    vencidas.sort(reverse=True)
+    obrigatorias = pelo_sitemap + pela_idade
+    vagas = len(vencidas) if orcamento is None else max(0, min(len(vencidas), orcamento - obrigatorias))
+    carregados.extend(em_dia)
+    carregados.extend(url for _, _, url in vencidas[vagas:])
+    tqdm.write(f"Modo agendado: {obrigatorias} obrigatórios (novos, lastmod alterado ou há {idade_maxima:g}+ dias), "
+               f"{vagas} de {len(vencidas)} vencidos por prioridade, {len(em_dia) + len(vencidas) - vagas} mantidos.")
+    if orcamento is not None and obrigatorias > orcamento:
+        tqdm.write(f"⚠️ Obrigatórios excedem o orçamento de {orcamento}: {pelo_sitemap} novos ou com lastmod "
+                   f"alterado e {pela_idade} sem verificação há {idade_maxima:g}+ dias; todos são coletados, nenhum vencido entra.")
+    for _, _, url in vencidas[:vagas]:
+        yield url
+
+def track_total(urls, pbar):
+    """
+    Aumenta o total da barra de progresso conforme novas URLs entram na fila de coleta. Não
+    redesenha a barra: o próximo update() já mostra o total novo, respeitando o mininterval
+    do tqdm (fora de um terminal, cada redesenho vira uma linha no log).
+    """
+    for url in urls:
+        pbar.total = (pbar.total or 0) + 1
+        yield url
+
+def carry_forward(conn, timestamp, urls):
+    """
+    Produtos não re-coletados mantêm o último estado: como `observacoes` só registra
+    mudanças, basta marcar a verificação em `produtos` e `estado_atual`.
+    Não abre transação própria (roda dentro de finish_run).
+    """
+    conn.executemany("UPDATE produtos SET ultima_coleta = ? WHERE url = ?", [(timestamp, url) for url in urls])
+    conn.executemany("UPDATE estado_atual SET data_coleta = ? WHERE url = ?", [(timestamp, url) for url in urls])
+    return len(urls)
+
+# --- 5c. EXECUÇÕES E FRONTEIRA (RETOMADA) ---
+# Status na fronteira: 'pendente' (descoberta, ainda não coletada), 'coletado', 'erro'
+# e 'mantido' (modo incremental, sem re-coleta)
+class CrawlRun:
+    """
+    Uma execução de coleta (linha em `execucoes`) e o estado que a gravação em lote precisa:
+    o timestamp único da execução, o lastmod de cada URL e o último estado de cada produto.
+    """
+    def __init__(self, conn, run_id, timestamp, descoberta_concluida=False, retomada=False):
+        self.conn = conn
+        self.id = run_id
+        self.timestamp = timestamp
+        self.descoberta_concluida = descoberta_concluida
+        self.retomada = retomada
+        self.lastmods = {}
+        self.last_states = load_last_states(conn)
+        self.inalterados = 0
+
+def start_run(conn):
+    """
+    Retoma a execução interrompida mais recente (status 'em_andamento'), se houver,
+    mantendo o timestamp dela; senão abre uma nova.
+    """
+    row = conn.execute(
+        "SELECT id, data_coleta, descoberta_concluida FROM execucoes WHERE status = 'em_andamento' ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    if row:
+        return CrawlRun(conn, row[0], row[1], bool(row[2]), retomada=True)
 
-# --- 5. LOOP PRINCIPAL ---
-def main():
-    conn = setup_database()
-    cursor = conn.cursor()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        cursor = conn.execute("INSERT INTO execucoes (data_coleta, status) VALUES (?, 'em_andamento')", (timestamp,))
+    return CrawlRun(conn, cursor.lastrowid, timestamp)
+
+def pending_urls(run):
+    """URLs que faltam numa execução retomada cuja descoberta já tinha terminado."""
+    rows = run.conn.execute(
+        "SELECT url, lastmod FROM fronteira WHERE execucao_id = ? AND status IN ('pendente', 'erro')", (run.id,)
+    ).fetchall()
+    run.lastmods.update(rows)
+    return [url for url, _ in rows]
+
+def persist_frontier(run, urls, carregados, pipeline):
+    """
+    Registra cada URL descoberta na fronteira ('pendente') antes de entregá-la à coleta,
+    pulando as já coletadas numa tentativa anterior da mesma execução. Quem grava é a thread
+    de escrita do `pipeline`, que ao fim da descoberta roda finish_discovery.
+    """
+    feitos = {
+        url for (url,) in
+        run.conn.execute("SELECT url FROM fronteira WHERE execucao_id = ? AND status = 'coletado'", (run.id,))
+    }
+    for url in urls:
+        if url in feitos:
+            continue
+        pipeline.register_pending(url, run.lastmods.get(url))
+        yield url
+    pipeline.discovery_done(carregados)
+
+def finish_discovery(run, carregados):
+    """
+    Grava os mantidos pelo modo incremental e marca a descoberta como concluída: a partir
+    daí, uma retomada lê só a fronteira.
+    """
+    conn = run.conn
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO fronteira (execucao_id, url, lastmod, status) VALUES (?, ?, ?, 'mantido')",
+            [(run.id, url, run.lastmods.get(url)) for url in carregados]
+        )
+        conn.execute("UPDATE execucoes SET descoberta_concluida = 1 WHERE id = ?", (run.id,))
+    run.descoberta_concluida = True
 
+def finish_run(run):
+    """
+    Fecha a execução numa única transação: mantém o estado dos produtos não re-coletados,
+    recalcula os agregados do dia com o catálogo inteiro, marca a execução como concluída
+    e descarta a fronteira. Retorna quantos produtos foram mantidos sem re-coleta.
+    """
+    conn = run.conn
+    with conn:
+        mantidos = [
+            url for (url,) in
+            conn.execute("SELECT url FROM fronteira WHERE execucao_id = ? AND status = 'mantido'", (run.id,))
+        ]
+        carry_forward(conn, run.timestamp, mantidos)
+        refresh_daily_aggregates(conn, run.timestamp[:10])
+        evict_response_cache(conn)
+        conn.execute(
+            "UPDATE execucoes SET status = 'concluida', fim = ? WHERE id = ?",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), run.id)
+        )
+        conn.execute("DELETE FROM fronteira WHERE execucao_id = ?", (run.id,))
+    return len(mantidos)
+
+# Gravações compartilhadas por save_batch e pela junção das partes (merge_shards)
+UPSERT_PRODUTO_SQL = '''
+    INSERT INTO produtos (url, produto_nome, sku, categoria, imagem_url, tags, variante_id, primeira_coleta, ultima_coleta)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        produto_nome = excluded.produto_nome,
+        sku = excluded.sku,
+        categoria = excluded.categoria,
+        imagem_url = excluded.imagem_url,
+        tags = excluded.tags,
+        variante_id = excluded.variante_id,
+        ultima_coleta = excluded.ultima_coleta
+'''
+UPSERT_LASTMOD_SQL = '''
+    INSERT INTO sitemap_lastmod (url, lastmod, ultima_coleta) VALUES (?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET lastmod = excluded.lastmod, ultima_coleta = excluded.ultima_coleta
+'''
+UPSERT_ESTATISTICA_SQL = '''
+    INSERT INTO estatisticas_coleta (url, verificacoes, mudancas, primeira_verificacao, ultima_verificacao, ultima_mudanca)
+    VALUES (?, 1, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        verificacoes = verificacoes + 1,
+        mudancas = mudancas + excluded.mudancas,
+        ultima_verificacao = excluded.ultima_verificacao,
+        ultima_mudanca = COALESCE(excluded.ultima_mudanca, ultima_mudanca)
+'''
+INSERT_OBSERVACAO_SQL = '''
+    INSERT INTO observacoes (produto_id, data_coleta, preco_original, preco_atual, em_promocao, disponivel, metodo_verificacao)
+    VALUES ((SELECT id FROM produtos WHERE url = ?), ?, ?, ?, ?, ?, ?)
+'''
+UPSERT_CACHE_SQL = '''
+    INSERT INTO cache_respostas (url, etag, last_modified, hash, acessado_em) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        etag = excluded.etag,
+        last_modified = excluded.last_modified,
+        hash = excluded.hash,
+        acessado_em = excluded.acessado_em
+'''
+
+def save_batch(run, results, falhas=(), pendentes=()):
+    """
+    Grava um lote de produtos numa única transação (executemany). Registra na fronteira as URLs
+    descobertas desde o último lote (`pendentes`, [(url, lastmod)]), atualiza `produtos`, o
+    lastmod do sitemap e as estatísticas de coleta (verificações e mudanças de cada URL) e
+    insere em `observacoes` só os produtos que mudaram de estado em relação ao último estado em
+    memória, com o que mudou em `change_events`. Os inalterados (304/mesmo hash) só têm a
+    verificação registrada, como em carry_forward. Por fim atualiza o cache de respostas e o
+    status das URLs (coletadas e com erro) na fronteira da execução.
+    Retorna quantas mudanças foram gravadas.
+    """
+    conn, timestamp = run.conn, run.timestamp
+    coletados = results
+    inalterados = [result['url'] for result in coletados if result.get('unchanged')]
+    results = [result for result in coletados if not result.get('unchanged')]
+    mudancas, eventos, mudaram = [], [], set()
+    for result in results:
+        state = product_state(result)
+        anterior = run.last_states.get(result['url'])
+        if anterior != state:
+            mudancas.append((result['url'], timestamp, *state, result['method']))
+            eventos.extend((result['url'], timestamp, *evento) for evento in detect_changes(anterior, state))
+            if anterior is not None:
+                mudaram.add(result['url'])
+
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO fronteira (execucao_id, url, lastmod, status) VALUES (?, ?, ?, 'pendente')",
+            [(run.id, url, lastmod) for url, lastmod in pendentes]
+        )
+        conn.executemany(UPSERT_PRODUTO_SQL, [(
+            result['url'],
+            result['title'],
+            result['sku'],
+            result['categoria'],
+            result['imagem_url'],
+            result['tags'],
+            result['id'],
+            timestamp,
+            timestamp
+        ) for result in results])
+        conn.executemany(
+            UPSERT_LASTMOD_SQL, [(result['url'], run.lastmods.get(result['url']), timestamp) for result in coletados]
+        )
+        conn.executemany(UPSERT_ESTATISTICA_SQL, [(
+            result['url'], int(result['url'] in mudaram), timestamp, timestamp,
+            timestamp if result['url'] in mudaram else None
+        ) for result in coletados])
+        conn.executemany(INSERT_OBSERVACAO_SQL, mudancas)
+        conn.executemany(INSERT_EVENTO_SQL, eventos)
+        if results:
+            update_latest_state(conn, timestamp, results)
+        carry_forward(conn, timestamp, inalterados)
+
+        # Estoque vindo do HTML pode mudar sem o JSON mudar: esses ficam fora do cache. Os vindos
+        # do catálogo em lote não têm validadores do JSON individual: a entrada antiga sai, senão
+        # um 304/mesmo hash na próxima coleta individual desfaria o estado gravado agora
+        conn.executemany(UPSERT_CACHE_SQL, [
+            (result['url'], *result['cache'], timestamp) for result in coletados
+            if 'cache' in result and result.get('method', 'JSON') == 'JSON'
+        ])
+        conn.executemany(
+            "DELETE FROM cache_respostas WHERE url = ?",
+            [(result['url'],) for result in results if result['method'] != 'JSON' or 'cache' not in result]
+        )
+
+        conn.executemany(
+            "UPDATE fronteira SET status = 'coletado', erro = NULL WHERE execucao_id = ? AND url = ?",
+            [(run.id, result['url']) for result in coletados]
+        )
+        conn.executemany(
+            "UPDATE fronteira SET status = 'erro', erro = ? WHERE execucao_id = ? AND url = ?",
+            [(falha['error'], run.id, falha.get('url')) for falha in falhas]
+        )
+
+    for url, _, *state, _ in mudancas:
+        run.last_states[url] = tuple(state)
+    run.inalterados += len(inalterados)
+    return len(mudancas)
+
+# --- 5d. COLETA DIVIDIDA EM PARTES (SHARDS) ---
+# Com --shard i/N, o processo coleta só as URLs cujo hash cai na parte i e grava num banco
+# parcial (SHARDS_DIR/parte-i-de-N.db), semeado com uma cópia do banco principal para ter o
+# último estado, o cache de respostas e os lastmods. --juntar-shards N leva para o banco
+# principal o que cada parte gravou na sua execução, sob um único timestamp.
+def parse_shard(valor):
+    """Converte 'i/N' (1 <= i <= N) em (i, N), para o argparse."""
+    try:
+        indice, total = (int(parte) for parte in valor.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"use o formato i/N (ex.: 2/4), não '{valor}'")
+    if not 1 <= indice <= total:
+        raise argparse.ArgumentTypeError(f"parte fora do intervalo 1..{total}: '{valor}'")
+    return indice, total
+
+def shard_of(url, total):
+    """Parte (1..total) de uma URL: estável entre execuções, processos e máquinas."""
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), 'big') % total + 1
+
+def filter_shard(urls, indice, total):
+    """Deixa passar só as URLs da parte `indice` (gerador, como as demais etapas da descoberta)."""
+    for url in urls:
+        if shard_of(url, total) == indice:
+            yield url
+
+def shard_db_path(indice, total):
+    return os.path.join(SHARDS_DIR, f"parte-{indice}-de-{total}.db")
+
+def remove_db(caminho):
+    for arquivo in (caminho, f"{caminho}-wal", f"{caminho}-shm"):
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
+
+def open_shard_db(indice, total):
+    """
+    Abre o banco da parte. Se ele tem uma execução interrompida, é mantido (e retomado);
+    senão é recriado a partir de uma cópia do banco principal. O id da última execução
+    herdada fica em PRAGMA user_version: o que vier depois dele é da parte.
+    """
+    caminho = shard_db_path(indice, total)
+    if os.path.exists(caminho):
+        conn = setup_database(caminho)
+        if conn.execute("SELECT 1 FROM execucoes WHERE status = 'em_andamento'").fetchone():
+            return conn
+        conn.close()
+        remove_db(caminho)
+
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    if os.path.exists(DB_NAME):
+        with closing(sqlite3.connect(DB_NAME)) as origem, closing(sqlite3.connect(caminho)) as destino:
+            origem.backup(destino)
+    conn = setup_database(caminho)
+    with conn:
+        # Uma execução interrompida do banco principal não é retomada dentro da parte
+        conn.execute("UPDATE execucoes SET status = 'interrompida' WHERE status = 'em_andamento'")
+        conn.execute("DELETE FROM fronteira")
+        herdada = conn.execute("SELECT COALESCE(MAX(id), 0) FROM execucoes").fetchone()[0]
+    conn.execute(f"PRAGMA user_version = {int(herdada)}")
+    return conn
+
+def read_shard(caminho):
+    """
+    Lê o que a execução de uma parte gravou: linhas de produtos, observações, eventos, lastmods,
+    estatísticas de coleta, cache, estado_atual e run_metrics com o timestamp dela. Numa parte
+    interrompida, os mantidos pelo modo incremental ainda estão só na fronteira e entram como
+    verificados.
+    Retorna None se a parte não chegou a abrir uma execução.
+    """
+    with closing(sqlite3.connect(caminho)) as conn:
+        herdada = conn.execute("PRAGMA user_version").fetchone()[0]
+        row = conn.execute(
+            "SELECT id, data_coleta, status FROM execucoes WHERE id > ? ORDER BY id DESC LIMIT 1", (herdada,)
+        ).fetchone()
+        if row is None:
+            return None
+        run_id, timestamp, status = row
+        mantidos = conn.execute(
+            "SELECT url FROM fronteira WHERE execucao_id = ? AND status = 'mantido'", (run_id,)
+        ).fetchall() if status != 'concluida' else []
+        verificados = {url for (url,) in conn.execute("SELECT url FROM produtos WHERE ultima_coleta = ?", (timestamp,))}
+        verificados.update(url for (url,) in mantidos)
+        metricas = conn.execute("SELECT * FROM run_metrics WHERE execucao_id = ? ORDER BY id", (run_id,))
+        colunas = [col[0] for col in metricas.description]
+        return {
+            'timestamp': timestamp,
+            'status': status,
+            'produtos': [row for row in conn.execute(
+                "SELECT url, produto_nome, sku, categoria, imagem_url, tags, variante_id FROM produtos"
+            ) if row[0] in verificados],
+            'observacoes': conn.execute('''
+                SELECT p.url, o.preco_original, o.preco_atual, o.em_promocao, o.disponivel, o.metodo_verificacao
+                FROM observacoes o
+                JOIN produtos p ON p.id = o.produto_id
+                WHERE o.data_coleta = ?
+                ORDER BY o.id
+            ''', (timestamp,)).fetchall(),
+            'eventos': conn.execute('''
+                SELECT p.url, e.tipo, e.preco_anterior, e.preco_novo, e.variacao_pct
+                FROM change_events e
+                JOIN produtos p ON p.id = e.produto_id
+                WHERE e.data_coleta = ?
+                ORDER BY e.id
+            ''', (timestamp,)).fetchall(),
+            'lastmods': conn.execute(
+                "SELECT url, lastmod FROM sitemap_lastmod WHERE ultima_coleta = ?", (timestamp,)
+            ).fetchall(),
+            'estatisticas': conn.execute(
+                "SELECT url, verificacoes, mudancas, primeira_verificacao, ultima_verificacao, ultima_mudanca "
+                "FROM estatisticas_coleta WHERE ultima_verificacao = ?", (timestamp,)
+            ).fetchall(),
+            'cache': conn.execute(
+                "SELECT url, etag, last_modified, hash FROM cache_respostas WHERE acessado_em = ?", (timestamp,)
+            ).fetchall(),
+            'estado': [row for row in conn.execute(
+                "SELECT sku, url, produto_nome, categoria, imagem_url, preco_original, preco_atual, em_promocao, "
+                "disponivel FROM estado_atual"
+            ) if row[1] in verificados],
+            'metricas': [dict(zip(colunas, row)) for row in metricas],
+        }
+
+def merge_shards(total, deltas=False):
+    """
+    Junta no banco principal, numa única transação, o que as `total` partes gravaram: uma
+    única linha em `execucoes`, com o timestamp da parte que começou primeiro, e observações,
+    eventos, verificações, lastmods, estatísticas de coleta, cache e estado_atual de todas as
+    partes sob esse timestamp.
+    Partes interrompidas entram com o que chegaram a gravar. Os bancos juntados são apagados.
+    Com `deltas`, grava também o delta da execução juntada. Retorna quantas partes foram juntadas.
+    """
+    partes = []
+    for indice in range(1, total + 1):
+        caminho = shard_db_path(indice, total)
+        parte = read_shard(caminho) if os.path.exists(caminho) else None
+        if parte is None:
+            print(f"⚠️ Parte {indice}/{total} sem execução para juntar ({caminho}).", flush=True)
+            continue
+        if parte['status'] != 'concluida':
+            print(f"⚠️ Parte {indice}/{total} foi interrompida: entra só o que chegou a ser coletado.", flush=True)
+        partes.append((caminho, parte))
+    if not partes:
+        print("Nenhuma parte para juntar.", flush=True)
+        return 0
+
+    timestamp = min(parte['timestamp'] for _, parte in partes)
+    conn = setup_database()
+    atributos = load_product_attributes(conn) if deltas else None
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO execucoes (data_coleta, status, descoberta_concluida) VALUES (?, 'em_andamento', 1)",
+            (timestamp,)
+        ).lastrowid
+        for _, parte in partes:
+            conn.executemany(UPSERT_PRODUTO_SQL, [(*row, timestamp, timestamp) for row in parte['produtos']])
+            conn.executemany(INSERT_OBSERVACAO_SQL, [(url, timestamp, *state) for url, *state in parte['observacoes']])
+            conn.executemany(INSERT_EVENTO_SQL, [(url, timestamp, *evento) for url, *evento in parte['eventos']])
+            conn.executemany(UPSERT_LASTMOD_SQL, [(url, lastmod, timestamp) for url, lastmod in parte['lastmods']])
+            conn.executemany(
+                "INSERT OR REPLACE INTO estatisticas_coleta VALUES (?, ?, ?, ?, ?, ?)",
+                [(*row[:3], *(timestamp if data == parte['timestamp'] else data for data in row[3:]))
+                 for row in parte['estatisticas']]
+            )
+            # O cache das URLs coletadas pela parte passa a ser o dela (inclusive as que saíram do cache)
+            conn.executemany("DELETE FROM cache_respostas WHERE url = ?", [(url,) for url, _ in parte['lastmods']])
+            conn.executemany(UPSERT_CACHE_SQL, [(*row, timestamp) for row in parte['cache']])
+            conn.executemany(UPSERT_ESTADO_SQL, [(*row, timestamp) for row in parte['estado']])
+            for metricas in parte['metricas']:
+                metricas = dict(metricas, execucao_id=run_id, data_coleta=timestamp)
+                del metricas['id']
+                conn.execute(
+                    f"INSERT INTO run_metrics ({', '.join(metricas)}) VALUES ({', '.join('?' * len(metricas))})",
+                    list(metricas.values())
+                )
+        refresh_daily_aggregates(conn, timestamp[:10])
+        evict_response_cache(conn)
+        conn.execute(
+            "UPDATE execucoes SET status = 'concluida', fim = ? WHERE id = ?",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), run_id)
+        )
+    delta = export_delta(conn, timestamp, atributos) if deltas else None
+    conn.close()
+
+    for caminho, _ in partes:
+        remove_db(caminho)
+    verificados = sum(len(parte['produtos']) for _, parte in partes)
+    mudancas = sum(len(parte['observacoes']) for _, parte in partes)
+    print(f"🧩 {len(partes)}/{total} partes juntadas na execução #{run_id} ({timestamp}): "
+          f"{verificados} produtos verificados, {mudancas} com mudança registrada.", flush=True)
+    if delta:
+        print(f"📦 Delta da execução gravado em {delta}.", flush=True)
+    return len(partes)
+
+# --- 6. LOOP PRINCIPAL ---
+def is_transient(result):
+    """Erros que valem nova tentativa: falhas de rede/timeout (status None) e status de sobrecarga."""
+    return 'status' in result and (result['status'] is None or result['status'] in STATUS_TRANSITORIOS)
+
+def main(modo=MODO_COLETA, workers=MAX_WORKERS, rps=REQUISICOES_POR_SEGUNDO, catalogo=False, incremental=False,
+         metricas_json=None, metricas_prometheus=None, shard=None, deltas=False, agendado=False, orcamento=None,
+         idade_maxima=IDADE_MAXIMA_DIAS):
+    global rate_limiter, controller, sessions, response_cache, metrics
+
+    metrics = RunMetrics()
+    conn = open_shard_db(*shard) if shard else setup_database()
+    run = start_run(conn)
+    response_cache = load_response_cache(conn)
+    atributos = load_product_attributes(conn) if deltas else None
+    if shard:
+        print(f"🧩 Parte {shard[0]}/{shard[1]}: gravando em {shard_db_path(*shard)} (junte com --juntar-shards {shard[1]}).")
+    if run.retomada:
+        print(f"♻️  Retomando a execução #{run.id} de {run.timestamp}, interrompida antes do fim.")
+
+    # Modo sequencial: um worker, com pausa aleatória entre produtos
+    paralelos, pausa = (workers, None) if modo == "concorrente" else (1, (0.5, 1.0))
+    pipeline = Pipeline(run, paralelos, pausa)
+
+    # Fase 1 (descoberta) e fase 2 (coleta) se sobrepõem: as URLs vão sendo coletadas
+    # enquanto os sub-sitemaps ainda estão sendo lidos
     print("--- FASE 1: Mapeando produtos ---")
-    sitemaps = get_product_sitemaps(MAIN_SITEMAP_URL)
-    todos_links = []
-    for sm in sitemaps:
-        print(f"Lendo sitemap: {sm}")
-        urls = get_product_urls(sm)
-        print(f"  > Encontrados {len(urls)} produtos.")
-        todos_links.extend(urls)
-    
-    total = len(todos_links)
-    print(f"\n📋 Coletando {total} produtos (Modo Sequencial Seguro)...")
-    
-    salvos = 0
-    
-    with tqdm(total=total, unit="prod") as pbar:
-        for url in todos_links:
-            result = get_product_data(url)
-            
-            if result and "error" not in result:
-                cursor.execute('''
-                    INSERT INTO historico_precos 
-                    (data_coleta, produto_nome, sku, categoria, url, imagem_url, tags, preco_original, preco_atual, em_promocao, disponivel, variante_id, metodo_verificacao)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    timestamp, 
-                    result['title'], 
-                    result['sku'], 
-                    result['categoria'], 
-                    result['url'], 
-                    result['imagem_url'],
-                    result['tags'],
-                    result['original'], 
-                    result['current'], 
-                    result['is_promo'], 
-                    result['available'], 
-                    result['id'],
-                    result['method']
-                ))
-                salvos += 1
-                if salvos % 10 == 0: conn.commit()
-            else:
-                # Opcional: Logar erro
-                # tqdm.write(f"Erro em {url}: {result.get('error')}")
-                pass
-            
-            pbar.update(1)
-            # Delay para evitar bloqueio
-            time.sleep(random.uniform(0.5, 1.0))
+    if run.descoberta_concluida:
+        todos_links = pending_urls(run)
+        print(f"Fronteira da execução: {len(todos_links)} URLs restantes.")
+    else:
+        carregados = []
+        todos_links = discover_products(MAIN_SITEMAP_URL, run.lastmods)
+        if shard:
+            todos_links = filter_shard(todos_links, *shard)
+        if incremental:
+            todos_links = plan_incremental(conn, todos_links, run.lastmods, carregados)
+        elif agendado:
+            todos_links = plan_scheduled(run, todos_links, carregados, orcamento, idade_maxima)
+        todos_links = persist_frontier(run, todos_links, carregados, pipeline)
 
-    conn.commit()
+    if modo == "concorrente":
+        rate_limiter = TokenBucket(rps)
+        controller = AdaptiveController(1, workers, inicial=max(1, workers // 2))
+        sessions = SessionPool(workers)
+        print(f"\n📋 Coletando produtos (Modo Concorrente: até {workers} requisições simultâneas, até {rps} req/s)...")
+    else:
+        controller = AdaptiveController(1, 1)
+        print("\n📋 Coletando produtos (Modo Sequencial Seguro)...")
+
+    # Fases sobrepostas: 'coleta' inclui a descoberta em andamento e as gravações em lote
+    with metrics.phase('coleta'):
+        with tqdm(total=0, unit="prod") as pbar:
+            catalogo_lote = get_catalog_products(STORE_URL) if catalogo else None
+            links = track_total(todos_links, pbar)
+            salvos, mudancas, para_repetir = pipeline.process(links, pbar, catalogo_lote)
+
+            # Repescagem: erros transitórios (rede, 429, 5xx) de novo no fim, com backoff exponencial e jitter
+            for tentativa in range(1, MAX_TENTATIVAS + 1):
+                if not para_repetir:
+                    break
+                espera = BACKOFF_BASE * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5)
+                tqdm.write(f"🔁 Repescagem {tentativa}/{MAX_TENTATIVAS}: {len(para_repetir)} produtos com erro transitório, "
+                           f"aguardando {espera:.1f}s...")
+                time.sleep(espera)
+                pbar.total += len(para_repetir)
+                pbar.refresh()
+                repetidos, mudancas_repescagem, para_repetir = Pipeline(run, paralelos, pausa).process(para_repetir, pbar)
+                salvos += repetidos
+                mudancas += mudancas_repescagem
+
+    with metrics.phase('escrita'):
+        mantidos = finish_run(run)
+    resumo = metrics.summary()
+    save_run_metrics(conn, run, resumo)
+    delta = export_delta(conn, run.timestamp, atributos) if deltas else None
     conn.close()
-    print(f"\n🏁 Sucesso! {salvos} produtos verificados.")
+    if metricas_json:
+        write_metrics_json(metricas_json, resumo)
+    if metricas_prometheus:
+        write_metrics_prometheus(metricas_prometheus, resumo)
+    rate_limiter = None
+    controller = None
+    response_cache = {}
+    print(f"\n🏁 Sucesso! {salvos} produtos verificados, {mudancas} com mudança registrada.")
+    if run.inalterados:
+        print(f"   {run.inalterados} sem alteração no JSON (304 ou mesmo conteúdo), sem reprocessar.")
+    if mantidos:
+        print(f"   {mantidos} produtos mantidos sem nova requisição (último estado conhecido).")
+    if delta:
+        print(f"   📦 Delta da execução gravado em {delta}.")
+    if para_repetir:
+        print(f"   ⚠️ {len(para_repetir)} produtos seguiram com erro após {MAX_TENTATIVAS} repescagens.")
+    fases = ", ".join(f"{fase} {segundos:.1f}s" for fase, segundos in resumo['fases_s'].items())
+    print(f"   ⏱️ {resumo['duracao_s']:.1f}s no total ({fases}); {resumo['requisicoes']} requisições, "
+          f"{resumo['erros_requisicao']} com erro, {resumo['bytes'] / 1e6:.2f} MB recebidos.")
+    if resumo['filas']:
+        filas = ", ".join(f"{nome} {fila['media']:.0f}/{fila['max']}" for nome, fila in resumo['filas'].items())
+        print(f"   📥 Filas entre estágios (média/máx): {filas}. A fila cheia fica antes do gargalo.")
+
+def run_shards(total, modo=MODO_COLETA, workers=MAX_WORKERS, rps=REQUISICOES_POR_SEGUNDO, catalogo=False,
+               incremental=False, deltas=False, agendado=False, orcamento=None, idade_maxima=IDADE_MAXIMA_DIAS):
+    """
+    Coleta em `total` processos locais, um por parte, e junta as partes no banco principal.
+    O teto de req/s (e o orçamento do modo agendado) é dividido entre os processos, para o
+    total ao host continuar o mesmo.
+    """
+    orcamento = math.ceil(orcamento / total) if orcamento is not None else None
+    with ProcessPoolExecutor(max_workers=total) as executor:
+        futuros = {
+            executor.submit(main, modo, workers, rps / total, catalogo, incremental, shard=(indice, total),
+                            agendado=agendado, orcamento=orcamento, idade_maxima=idade_maxima): indice
+            for indice in range(1, total + 1)
+        }
+        for futuro in as_completed(futuros):
+            try:
+                futuro.result()
+            except Exception as e:
+                print(f"⚠️ Parte {futuros[futuro]}/{total} falhou: {e}", flush=True)
+    merge_shards(total, deltas=deltas)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Coletor de preços e estoque - Alexandre Pavão")
+    parser.add_argument("--modo", choices=["sequencial", "concorrente"], default=MODO_COLETA,
+                        help="Modo de coleta (padrão: sequencial)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Máximo de requisições simultâneas no modo concorrente (o controle adaptativo começa pela metade)")
+    parser.add_argument("--rps", type=float, default=REQUISICOES_POR_SEGUNDO,
+                        help="Máximo de requisições por segundo ao host no modo concorrente")
+    parser.add_argument("--catalogo", action="store_true",
+                        help="Lê os produtos em lote via /products.json (coleta individual só para o que faltar)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Só re-coleta produtos com <lastmod> alterado no sitemap (mais uma amostra rotativa)")
+    parser.add_argument("--agendado", action="store_true",
+                        help="Re-coleta conforme a frequência de mudança de cada produto (e o lastmod do sitemap)")
+    parser.add_argument("--orcamento", type=int, metavar="N",
+                        help="Modo agendado: teto de produtos re-coletados na execução (além dos obrigatórios)")
+    parser.add_argument("--idade-maxima", type=float, default=IDADE_MAXIMA_DIAS, metavar="DIAS",
+                        help=f"Modo agendado: dias máximos sem verificar um produto (padrão: {IDADE_MAXIMA_DIAS:g})")
+    parser.add_argument("--exportar-parquet", action="store_true",
+                        help=f"Não coleta: só atualiza o arquivo Parquet do histórico em {ARQUIVO_DIR}/ (requer pyarrow)")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N",
+                        help=f"Coleta só a parte i de N das URLs (divididas por hash), num banco parcial em {SHARDS_DIR}/")
+    parser.add_argument("--juntar-shards", type=int, metavar="N",
+                        help="Não coleta: junta no banco principal as N partes de uma coleta com --shard")
+    parser.add_argument("--processos", type=int, metavar="N",
+                        help="Divide a coleta em N processos locais (--shard 1/N a N/N) e junta as partes no fim")
+    parser.add_argument("--deltas", action="store_true",
+                        help=f"Grava também o delta da execução em {DELTAS_DIR}/AAAA/MM/DD/ (NDJSON + zstd, requer zstandard)")
+    parser.add_argument("--exportar-deltas", action="store_true",
+                        help=f"Não coleta: grava em {DELTAS_DIR}/ os deltas de todo o histórico do banco")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help=f"Não coleta: refaz o banco a partir dos deltas em {DELTAS_DIR}/")
+    parser.add_argument("--metricas-json", metavar="ARQUIVO",
+                        help="Grava as métricas da execução (tempos, latências, status, bytes) em JSON")
+    parser.add_argument("--metricas-prometheus", metavar="ARQUIVO",
+                        help="Grava as métricas no formato texto do Prometheus (textfile collector)")
+    args = parser.parse_args()
+    if args.processos and (args.shard or args.metricas_json or args.metricas_prometheus):
+        parser.error("--processos não combina com --shard nem com os arquivos de métricas (cada parte grava as suas em run_metrics)")
+    if args.incremental and args.agendado:
+        parser.error("use --incremental ou --agendado (o agendado já considera o lastmod do sitemap)")
+    if args.orcamento is not None and not args.agendado:
+        parser.error("--orcamento só vale com --agendado")
+    if args.shard and args.deltas:
+        parser.error("--deltas vai na junção (--juntar-shards), não em cada parte")
+    if args.exportar_parquet:
+        conn = setup_database()
+        export_parquet(conn)
+        conn.close()
+    elif args.exportar_deltas:
+        conn = setup_database()
+        export_history_deltas(conn)
+        conn.close()
+    elif args.reconstruir:
+        if rebuild_from_deltas() is None:
+            parser.exit(1)
+    elif args.juntar_shards:
+        merge_shards(args.juntar_shards, deltas=args.deltas)
+    elif args.processos:
+        run_shards(args.processos, modo=args.modo, workers=args.workers, rps=args.rps, catalogo=args.catalogo,
+                   incremental=args.incremental, deltas=args.deltas, agendado=args.agendado, orcamento=args.orcamento,
+                   idade_maxima=args.idade_maxima)
+    else:
+        main(modo=args.modo, workers=args.workers, rps=args.rps, catalogo=args.catalogo, incremental=args.incremental,
+             metricas_json=args.metricas_json, metricas_prometheus=args.metricas_prometheus, shard=args.shard,
+             deltas=args.deltas, agendado=args.agendado, orcamento=args.orcamento, idade_maxima=args.idade_maxima)
@@ -0,0 +1,122 @@
+"""
+Benchmark das funções de análise do dashboard sobre históricos sintéticos de 10 mil, 1 milhão
+e 10 milhões de linhas (mesmas colunas que `load_data` devolve).
+
+Para cada tamanho, gera o DataFrame em memória (produtos × coletas, com mudanças esporádicas
+de preço e estoque) e cronometra os passos que o `main()` do dashboard executa a cada
+interação: último registro por SKU, agregados, métricas de promoção, variações de preço,
+maiores quedas/aumentos, mudanças de disponibilidade e a redução da série do gráfico.
+
+Uso:
+    python benchmarks/bench_dashboard.py
+    python benchmarks/bench_dashboard.py --linhas 10000 1000000 --repeticoes 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dashboard  # noqa: E402
+
+COLETAS = 60  # Coletas por produto no histórico sintético
+
+def synthetic_history(linhas, semente=42):
+    """Histórico com `linhas` registros: linhas / COLETAS produtos, uma linha por produto e coleta."""
+    rng = np.random.default_rng(semente)
+    n_produtos = max(1, linhas // COLETAS)
+    produto = np.arange(linhas) % n_produtos
+    coleta = np.arange(linhas) // n_produtos
+
+    nomes = np.array([f"Produto {i}" for i in range(n_produtos)], dtype=object)
+    skus = np.array([f"SKU-{i:07d}" for i in range(n_produtos)], dtype=object)
+    urls = np.array([f"https://loja.exemplo/products/produto-{i}" for i in range(n_produtos)], dtype=object)
+    categorias = np.array([f"Categoria {i}" for i in range(12)], dtype=object)
+
+    base = rng.uniform(50, 500, n_produtos)
+    # Cerca de 2% dos registros mudam de preço em relação à coleta anterior do produto
+    variacao = np.where(rng.random(linhas) < 0.02, rng.uniform(-0.2, 0.2, linhas), 0.0)
+    preco_atual = np.round(base[produto] * (1 + variacao), 2)
+    em_promocao = (rng.random(linhas) < 0.2).astype(int)
+    preco_original = np.where(em_promocao == 1, np.round(preco_atual * 1.3, 2), preco_atual)
+
+    return pd.DataFrame({
+        'data_coleta': pd.Timestamp("2026-01-01") + pd.to_timedelta(coleta, unit="D"),
+        'produto_nome': nomes[produto],
+        'sku': skus[produto],
+        'categoria': categorias[produto % len(categorias)],
+        'url': urls[produto],
+        'preco_original': preco_original,
+        'preco_atual': preco_atual,
+        'em_promocao': em_promocao,
+        'disponivel': (rng.random(linhas) < 0.9).astype(int),
+    })
+
+def cronometrar(func, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {"ms_mediana": round(statistics.median(tempos), 2), "ms_min": round(min(tempos), 2)}, resultado
+
+def bench_size(linhas, repeticoes):
+    inicio = time.perf_counter()
+    df = synthetic_history(linhas)
+    geracao_s = time.perf_counter() - inicio
+
+    passos = {}
+    passos["ultimo_por_sku"], df_latest = cronometrar(
+        lambda: df.sort_values(by="data_coleta", ascending=False).drop_duplicates(subset="sku", keep="first"),
+        repeticoes
+    )
+    passos["aggregate_snapshot"], snapshot = cronometrar(lambda: dashboard.aggregate_snapshot(df_latest), repeticoes)
+    passos["calculate_promotion_metrics"], _ = cronometrar(
+        lambda: dashboard.calculate_promotion_metrics(snapshot), repeticoes
+    )
+    passos["calculate_price_changes"], changes = cronometrar(lambda: dashboard.calculate_price_changes(df), repeticoes)
+    passos["top_quedas_e_aumentos"], _ = cronometrar(
+        lambda: (dashboard.get_top_price_drops(changes), dashboard.get_top_price_increases(changes)), repeticoes
+    )
+    passos["get_availability_changes"], _ = cronometrar(lambda: dashboard.get_availability_changes(df), repeticoes)
+    passos["top_produtos_grafico"], df_top = cronometrar(
+        lambda: df[df['produto_nome'].isin(df['produto_nome'].value_counts().head(5).index)], repeticoes
+    )
+    passos["downsample_history"], df_grafico = cronometrar(lambda: dashboard.downsample_history(df_top), repeticoes)
+
+    return {
+        "linhas": linhas,
+        "produtos": df['sku'].nunique(),
+        "memoria_mb": round(df.memory_usage(deep=True).sum() / 1e6, 1),
+        "pontos_grafico": {"antes": len(df_top), "depois": len(df_grafico)},
+        "geracao_s": round(geracao_s, 2),
+        "ms_total_mediana": round(sum(p["ms_mediana"] for p in passos.values()), 2),
+        "passos": passos,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das análises do dashboard em históricos sintéticos")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", help="Também grava o JSON neste arquivo")
+    args = parser.parse_args()
+
+    resultados = []
+    for linhas in args.linhas:
+        print(f"Histórico de {linhas} linhas...", file=sys.stderr, flush=True)
+        resultados.append(bench_size(linhas, args.repeticoes))
+
+    saida = json.dumps({"coletas_por_produto": COLETAS, "repeticoes": args.repeticoes, "tamanhos": resultados},
+                       indent=2, ensure_ascii=False)
+    print(saida)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida)
+
+if __name__ == "__main__":
+    main()
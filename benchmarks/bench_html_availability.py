@@ -0,0 +1,98 @@
+"""
+Micro-benchmark da checagem de estoque via HTML (caminho HTML_CHECK do app.py).
+
+Compara, sobre páginas de produto salvas em disco, a checagem antiga (baixa o texto inteiro,
+procura duas grafias fixas do schema.org e cai no BeautifulSoup) com o extrator em streaming
+(`app.extract_availability`), que para na primeira pista conclusiva.
+
+Uso:
+    # salvar algumas páginas para usar como amostra
+    python benchmarks/bench_html_availability.py paginas/ --salvar https://www.alexandrepavao.com/products/...
+    # rodar o benchmark
+    python benchmarks/bench_html_availability.py paginas/ --repeticoes 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import app  # noqa: E402
+
+CHUNK = 16384
+
+def legacy_check(html):
+    """Checagem original do check_html_availability, sobre o texto completo da página."""
+    if '"availability": "http://schema.org/InStock"' in html or '"availability":"http://schema.org/InStock"' in html:
+        return True
+    if '"availability": "http://schema.org/OutOfStock"' in html:
+        return False
+    soup = BeautifulSoup(html, 'html.parser')
+    for btn in soup.find_all('button', type='submit'):
+        if 'esgotado' in btn.text.lower() or 'sold out' in btn.text.lower():
+            return False
+    return True
+
+def chunks(data):
+    return (data[i:i + CHUNK] for i in range(0, len(data), CHUNK))
+
+def cronometrar(func, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+def salvar_paginas(pasta, urls):
+    pasta.mkdir(parents=True, exist_ok=True)
+    for url in urls:
+        r = app.http_get(url, timeout=15)
+        destino = pasta / f"{app.product_handle(url)}.html"
+        destino.write_bytes(r.content)
+        print(f"{url} -> {destino} ({len(r.content)} bytes, status {r.status_code})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da checagem de estoque via HTML")
+    parser.add_argument("pasta", type=Path, help="Pasta com páginas de produto salvas (*.html)")
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--salvar", nargs="+", metavar="URL", help="Baixa as URLs para a pasta e sai")
+    args = parser.parse_args()
+
+    if args.salvar:
+        salvar_paginas(args.pasta, args.salvar)
+        return
+
+    paginas = sorted(args.pasta.glob("*.html"))
+    if not paginas:
+        sys.exit(f"Nenhuma página .html em {args.pasta}")
+
+    resultados = []
+    for pagina in paginas:
+        data = pagina.read_bytes()
+        ms_antigo, antigo = cronometrar(lambda: legacy_check(data.decode('utf-8', errors='replace')), args.repeticoes)
+        ms_novo, (novo, pista, lidos) = cronometrar(lambda: app.extract_availability(chunks(data)), args.repeticoes)
+        resultados.append({
+            "pagina": pagina.name,
+            "bytes": len(data),
+            "bytes_lidos": lidos,
+            "pista": pista,
+            "ms_antigo": round(ms_antigo, 3),
+            "ms_novo": round(ms_novo, 3),
+            "aceleracao": round(ms_antigo / ms_novo, 1) if ms_novo else None,
+            "mesmo_resultado": antigo == novo,
+        })
+
+    resumo = {
+        "paginas": len(resultados),
+        "ms_antigo_medio": round(sum(r["ms_antigo"] for r in resultados) / len(resultados), 3),
+        "ms_novo_medio": round(sum(r["ms_novo"] for r in resultados) / len(resultados), 3),
+        "fracao_bytes_lidos": round(sum(r["bytes_lidos"] for r in resultados) / sum(r["bytes"] for r in resultados), 3),
+        "divergencias": [r["pagina"] for r in resultados if not r["mesmo_resultado"]],
+    }
+    print(json.dumps({"resumo": resumo, "paginas": resultados}, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark de ponta a ponta do coletor (app.main) contra a loja sintética local (fake_store.py).
+
+Cada cenário roda numa pasta temporária, com banco novo, e mede produtos/s, requisições por
+produto (contadas no servidor) e as métricas da própria execução (RunMetrics). Os cenários
+`*_repetida` fazem uma primeira coleta, avançam a loja um "dia" (parte dos produtos muda) e
+medem só a segunda, que é a que se repete no dia a dia (cache de respostas, modo incremental).
+
+Uso:
+    python benchmarks/bench_scraper.py --produtos 2000 --latencia 0.02
+    python benchmarks/bench_scraper.py --cenarios concorrente concorrente_429 --produtos 500
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import app  # noqa: E402
+from fake_store import FakeStore  # noqa: E402
+
+# nome: (opções da loja, argumentos de app.main, coleta anterior)
+CENARIOS = {
+    "sequencial": ({}, dict(modo="sequencial"), False),
+    "concorrente": ({}, dict(modo="concorrente"), False),
+    "concorrente_429": ({"taxa_429": 0.05, "taxa_erro": 0.01}, dict(modo="concorrente"), False),
+    "catalogo": ({}, dict(modo="concorrente", catalogo=True), False),
+    "concorrente_repetida": ({}, dict(modo="concorrente"), True),
+    "incremental_repetida": ({}, dict(modo="concorrente", incremental=True), True),
+}
+
+def run_main(kwargs):
+    """Roda app.main sem a saída do coletor no stdout (o JSON do benchmark vai para lá)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.main(**kwargs)
+
+def run_scenario(nome, args):
+    opcoes_loja, kwargs, repetida = CENARIOS[nome]
+    kwargs = dict(kwargs, workers=args.workers, rps=args.rps)
+    produtos = min(args.produtos, args.max_sequencial) if kwargs["modo"] == "sequencial" else args.produtos
+
+    with tempfile.TemporaryDirectory() as pasta, FakeStore(produtos, args.latencia, **opcoes_loja) as loja:
+        app.DB_NAME = os.path.join(pasta, "bench.db")
+        app.STORE_URL = loja.url
+        app.MAIN_SITEMAP_URL = f"{loja.url}/sitemap.xml"
+        if repetida:
+            run_main(kwargs)
+            loja.advance()
+            loja.reset_counts()
+
+        inicio = time.perf_counter()
+        run_main(kwargs)
+        segundos = time.perf_counter() - inicio
+
+        resumo = app.metrics.summary()
+        verificados = sum(n for chave, n in resumo['produtos'].items() if not chave.startswith("FALHA"))
+        requisicoes = sum(loja.requisicoes.values())
+        return {
+            "cenario": nome,
+            "produtos": produtos,
+            "segundos": round(segundos, 3),
+            "produtos_por_s": round(produtos / segundos, 1),
+            "requisicoes": requisicoes,
+            "requisicoes_por_produto": round(requisicoes / produtos, 3),
+            "requisicoes_por_tipo": dict(loja.requisicoes),
+            "verificados": verificados,
+            "resultados": resumo['produtos'],
+            "fases_s": resumo['fases_s'],
+            "latencia_media_s": resumo['latencia']['media_s'],
+            "erros_requisicao": resumo['erros_requisicao'],
+            "bytes": resumo['bytes'],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do coletor contra uma loja sintética local")
+    parser.add_argument("--cenarios", nargs="+", choices=list(CENARIOS),
+                        default=[nome for nome in CENARIOS if nome != "sequencial"])
+    parser.add_argument("--produtos", type=int, default=1000)
+    parser.add_argument("--max-sequencial", type=int, default=50,
+                        help="Teto de produtos no cenário sequencial (tem pausa de 0,5-1s por produto)")
+    parser.add_argument("--latencia", type=float, default=0.02, help="Latência média (s) da loja sintética")
+    parser.add_argument("--workers", type=int, default=app.MAX_WORKERS)
+    parser.add_argument("--rps", type=float, default=50.0)
+    parser.add_argument("--saida", help="Também grava o JSON neste arquivo")
+    args = parser.parse_args()
+
+    resultados = []
+    for nome in args.cenarios:
+        print(f"Cenário {nome}...", file=sys.stderr, flush=True)
+        resultados.append(run_scenario(nome, args))
+
+    saida = json.dumps({
+        "parametros": {chave: valor for chave, valor in vars(args).items() if chave != "saida"},
+        "cenarios": resultados,
+    }, indent=2, ensure_ascii=False)
+    print(saida)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida)
+
+if __name__ == "__main__":
+    main()
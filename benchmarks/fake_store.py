@@ -0,0 +1,225 @@
+"""
+Loja Shopify de mentira, local, para medir o coletor sem tocar a loja real.
+
+Serve `sitemap.xml` (índice), os sitemaps de produtos, `/products/<handle>.json`, as páginas
+HTML dos produtos e o catálogo `/products.json`, para N produtos sintéticos. Latência, taxa de
+erros 500 e de respostas 429 (com Retry-After) são configuráveis, e as respostas JSON têm ETag
+(respondendo 304 a If-None-Match), como a Shopify.
+
+Uso isolado (para apontar o app.py manualmente):
+    python benchmarks/fake_store.py --produtos 1000 --latencia 0.05 --taxa-429 0.02
+Ou como módulo, nos benchmarks:
+    with FakeStore(produtos=1000) as loja:
+        ... loja.url ...
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+class FakeStore:
+    """
+    Servidor HTTP em thread própria. `requisicoes` conta as requisições por tipo de rota;
+    `advance()` simula o passar de um dia: uma fração dos produtos muda de preço/estoque
+    (e de lastmod no sitemap).
+    """
+    def __init__(self, produtos=1000, latencia=0.0, taxa_erro=0.0, taxa_429=0.0, retry_after=1,
+                 fracao_html=0.1, por_sitemap=5000, taxa_mudanca=0.05, porta=0, semente=42):
+        self.produtos = produtos
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.taxa_429 = taxa_429
+        self.retry_after = retry_after
+        self.fracao_html = fracao_html
+        self.por_sitemap = por_sitemap
+        self.taxa_mudanca = taxa_mudanca
+        self.random = random.Random(semente)
+        self.dia = 0
+        self.versao = [0] * produtos
+        self.requisicoes = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", porta), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def advance(self):
+        """Avança um dia: muda a versão de `taxa_mudanca` dos produtos."""
+        self.dia += 1
+        for i in self.random.sample(range(self.produtos), int(self.produtos * self.taxa_mudanca)):
+            self.versao[i] += 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.requisicoes = {}
+
+    # --- Conteúdo sintético ---
+    def product(self, i):
+        v = self.versao[i]
+        preco = 50 + (i * 37) % 450 + v * 5
+        promo = (i + v) % 4 == 0
+        html = (i * 7919) % 1000 < self.fracao_html * 1000
+        return {
+            "id": i,
+            "title": f"Produto {i}",
+            "handle": f"produto-{i}",
+            "product_type": f"Categoria {i % 12}",
+            "tags": ["sintetico", f"colecao-{i % 5}"],
+            "updated_at": self.lastmod(i),
+            "images": [{"src": f"{self.url}/cdn/{i}.jpg"}],
+            "variants": [{
+                "id": 100000 + i,
+                "sku": f"SKU-{i:07d}",
+                "price": f"{preco:.2f}",
+                "compare_at_price": f"{preco * 1.3:.2f}" if promo else None,
+                # Parte dos produtos esconde o estoque no JSON (força a checagem de HTML)
+                "available": None if html else (i + v) % 3 != 0,
+            }],
+        }
+
+    def lastmod(self, i):
+        return f"2026-01-{1 + min(self.versao[i], 27):02d}T00:00:00Z"
+
+    def _handler(self):
+        loja = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, code, body=b"", content_type="application/json", headers=()):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for nome, valor in headers:
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                caminho = url.path
+                tipo = (
+                    "sitemap" if caminho.startswith("/sitemap") else
+                    "catalogo" if caminho == "/products.json" else
+                    "json" if caminho.endswith(".json") else
+                    "html"
+                )
+                with loja.lock:
+                    loja.requisicoes[tipo] = loja.requisicoes.get(tipo, 0) + 1
+                if loja.latencia:
+                    time.sleep(loja.latencia * random.uniform(0.5, 1.5))
+
+                if tipo in ("json", "html", "catalogo"):
+                    sorteio = random.random()
+                    if sorteio < loja.taxa_429:
+                        return self.send(429, b"Too Many Requests", "text/plain",
+                                         [("Retry-After", str(loja.retry_after))])
+                    if sorteio < loja.taxa_429 + loja.taxa_erro:
+                        return self.send(500, b"Internal Server Error", "text/plain")
+
+                if caminho == "/sitemap.xml":
+                    n_sitemaps = max(1, -(-loja.produtos // loja.por_sitemap))
+                    itens = "".join(
+                        f"<sitemap><loc>{loja.url}/sitemap_products_{k}.xml</loc></sitemap>"
+                        for k in range(1, n_sitemaps + 1)
+                    )
+                    itens += f"<sitemap><loc>{loja.url}/sitemap_pages_1.xml</loc></sitemap>"
+                    return self.send(200, f'<?xml version="1.0"?><sitemapindex xmlns="{XMLNS}">{itens}</sitemapindex>'
+                                     .encode(), "application/xml")
+                if caminho.startswith("/sitemap_products_"):
+                    k = int(caminho[len("/sitemap_products_"):-len(".xml")])
+                    inicio = (k - 1) * loja.por_sitemap
+                    itens = "".join(
+                        f"<url><loc>{loja.url}/products/produto-{i}</loc><lastmod>{loja.lastmod(i)}</lastmod></url>"
+                        for i in range(inicio, min(loja.produtos, inicio + loja.por_sitemap))
+                    )
+                    return self.send(200, f'<?xml version="1.0"?><urlset xmlns="{XMLNS}"><url><loc>{loja.url}/</loc></url>'
+                                     f'{itens}</urlset>'.encode(), "application/xml")
+                if caminho.startswith("/sitemap_"):
+                    return self.send(200, f'<?xml version="1.0"?><urlset xmlns="{XMLNS}"></urlset>'.encode(),
+                                     "application/xml")
+                if tipo == "catalogo":
+                    query = parse_qs(url.query)
+                    limite = int(query.get("limit", ["30"])[0])
+                    pagina = int(query.get("page", ["1"])[0])
+                    produtos = [loja.product(i) for i in range((pagina - 1) * limite, min(loja.produtos, pagina * limite))]
+                    return self.send(200, json.dumps({"products": produtos}).encode())
+
+                if not caminho.startswith("/products/produto-"):
+                    return self.send(404, b"Not Found", "text/plain")
+                handle = caminho[len("/products/"):]
+                if handle.endswith(".json"):
+                    handle = handle[:-len(".json")]
+                try:
+                    i = int(handle[len("produto-"):])
+                except ValueError:
+                    return self.send(404, b"Not Found", "text/plain")
+                if not 0 <= i < loja.produtos:
+                    return self.send(404, b"Not Found", "text/plain")
+
+                produto = loja.product(i)
+                if tipo == "json":
+                    corpo = json.dumps({"product": produto}).encode()
+                    etag = f'"{hashlib.md5(corpo).hexdigest()}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.send(304, headers=[("ETag", etag)])
+                    return self.send(200, corpo, headers=[("ETag", etag)])
+
+                disponivel = (i + loja.versao[i]) % 3 != 0
+                schema = "InStock" if disponivel else "OutOfStock"
+                corpo = (
+                    f'<html><head><title>{produto["title"]}</title>'
+                    f'<script type="application/ld+json">{{"@type": "Product", "offers": '
+                    f'{{"availability": "https://schema.org/{schema}"}}}}</script></head>'
+                    f'<body>{"<p>descrição do produto</p>" * 400}</body></html>'
+                ).encode()
+                return self.send(200, corpo, "text/html; charset=utf-8")
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Loja Shopify sintética para benchmarks do coletor")
+    parser.add_argument("--produtos", type=int, default=1000)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência média (s) de cada resposta")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 500")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração de respostas 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Valor do Retry-After (s) nas respostas 429")
+    parser.add_argument("--fracao-html", type=float, default=0.1,
+                        help="Fração dos produtos sem estoque no JSON (checagem de HTML)")
+    args = parser.parse_args()
+
+    loja = FakeStore(args.produtos, args.latencia, args.taxa_erro, args.taxa_429, args.retry_after,
+                     args.fracao_html, porta=args.porta)
+    print(f"Loja sintética com {args.produtos} produtos em {loja.url} (Ctrl+C para sair)")
+    try:
+        loja.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
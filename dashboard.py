@@ -1,8 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import json
+import os
+import re
 import sqlite3
 import plotly.express as px
-from datetime import datetime
+from datetime import datetime, timedelta
+from pandas.api.types import union_categoricals
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -13,14 +18,186 @@ st.set_page_config(
 
 # --- CONSTANTES ---
 DB_NAME = "monitoramento_pavao.db"
+ARQUIVO_DIR = "arquivo_parquet"  # Histórico arquivado em Parquet pelo coletor (opcional)
+MAX_PONTOS_SERIE = 500           # Teto de pontos por produto enviados aos gráficos de evolução
+LTTB_MAX_DIAS = 90               # Até este período o gráfico usa LTTB; acima, baldes de mínimo/máximo
+ALERTAS_POR_PAGINA = 50          # Eventos de mudança por página na seção de alertas
+BUSCA_MAX_RESULTADOS = 20        # Produtos listados por busca (os mais relevantes)
+
+# Alertas: rótulo -> (tipos de change_events, variação mínima de preço em %)
+ALERTAS = {
+    "📦 Disponibilidade": (('stock_in', 'stock_out'), None),
+    "💰 Variações de Preço (>10%)": (('price_change',), 10),
+    "🏷️ Promoções": (('promo_start', 'promo_end'), None),
+}
+NOMES_EVENTO = {
+    'price_change': 'Mudança de preço',
+    'stock_in': 'Voltou ao estoque',
+    'stock_out': 'Esgotou',
+    'promo_start': 'Entrou em promoção',
+    'promo_end': 'Saiu da promoção',
+}
+
+# Colunas usadas pelo dashboard (e pelo CSV exportado)
+COLUNAS_DASHBOARD = [
+    'data_coleta', 'produto_nome', 'sku', 'categoria', 'url',
+    'preco_original', 'preco_atual', 'em_promocao', 'disponivel'
+]
+# Colunas das contagens agregadas (agregados_diarios ou aggregate_snapshot)
+COLUNAS_AGREGADOS = ['categoria', 'disponivel', 'em_promocao', 'total_produtos', 'soma_preco', 'soma_desconto_pct']
 
 # --- FUNÇÕES ---
-@st.cache_data(ttl=60) # Cache de 1 minuto para não sobrecarregar o banco
-def load_data():
+@st.cache_data(ttl=60)
+def load_filter_options():
+    """Período coberto e categorias existentes, sem carregar o histórico"""
     try:
         conn = sqlite3.connect(DB_NAME)
-        query = "SELECT * FROM historico_precos"
-        df = pd.read_sql_query(query, conn)
+        min_date = conn.execute("SELECT MIN(data_coleta) FROM observacoes").fetchone()[0]
+        max_date = conn.execute("SELECT MAX(ultima_coleta) FROM produtos").fetchone()[0]
+        categorias = [
+            row[0] for row in
+            conn.execute("SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL ORDER BY categoria")
+        ]
+        conn.close()
+    except Exception as e:
+        st.error(f"Erro ao carregar dados: {e}")
+        return None
+
+    if min_date is None:
+        return None
+    return pd.to_datetime(min_date).date(), pd.to_datetime(max_date).date(), categorias
+
+def filter_clauses(categoria, disponibilidade, promocao):
+    """Cláusulas WHERE (e parâmetros) dos filtros de categoria, disponibilidade e promoção"""
+    where, params = [], []
+
+    if categoria != "Todas":
+        where.append("categoria = ?")
+        params.append(categoria)
+
+    if disponibilidade == "Disponível":
+        where.append("disponivel = 1")
+    elif disponibilidade == "Indisponível":
+        where.append("disponivel = 0")
+
+    if promocao == "Em Promoção":
+        where.append("em_promocao = 1")
+    elif promocao == "Preço Normal":
+        where.append("em_promocao = 0")
+
+    return where, params
+
+def build_query(date_start, date_end, categoria, disponibilidade, promocao, ocultar_incompletas=True,
+                arquivado_ate=None):
+    """
+    Traduz os filtros da sidebar numa consulta parametrizada sobre historico_precos.
+    Com `arquivado_ate`, pula as observações já lidas do arquivo Parquet.
+
+    Como `observacoes` só guarda mudanças, o estado vigente no início do período pode ser
+    anterior a ele: com `date_start`, cada produto ainda verificado a partir dali ganha também
+    a sua última observação anterior, datada do início do período (linha "na data"), para que a
+    primeira coleta do recorte parta do valor correto.
+    """
+    where, params = filter_clauses(categoria, disponibilidade, promocao)
+    where_na_data, params_na_data = list(where), list(params)
+
+    # Execuções interrompidas (ainda não concluídas) deixam um retrato parcial do catálogo
+    incompletas = "data_coleta NOT IN (SELECT data_coleta FROM execucoes WHERE status <> 'concluida')"
+
+    if arquivado_ate is not None:
+        # id nulo = estado vigente na última verificação; execuções não concluídas também nunca
+        # vão para o arquivo
+        where.append("(id IS NULL OR data_coleta > ?"
+                     + ("" if ocultar_incompletas else f" OR NOT ({incompletas})") + ")")
+        params.append(arquivado_ate)
+
+    if ocultar_incompletas:
+        where.append(incompletas)
+
+    if date_start is not None:
+        where.append("data_coleta >= ?")
+        params.append(date_start.isoformat())
+    if date_end is not None:
+        where.append("data_coleta < ?")
+        params.append((date_end + timedelta(days=1)).isoformat())
+
+    query = f"SELECT {', '.join(COLUNAS_DASHBOARD)} FROM historico_precos"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+
+    if date_start is not None:
+        # Observações anteriores ao período nunca vêm do arquivo Parquet (lido a partir de date_start)
+        where_na_data[:0] = [
+            "id IN (SELECT MAX(id) FROM observacoes WHERE data_coleta < ?"
+            + (f" AND {incompletas}" if ocultar_incompletas else "") + " GROUP BY produto_id)",
+            "url IN (SELECT url FROM produtos WHERE ultima_coleta >= ?)",
+        ]
+        params_na_data[:0] = [date_start.isoformat(), date_start.isoformat()]
+        colunas = ["? AS data_coleta" if coluna == 'data_coleta' else coluna for coluna in COLUNAS_DASHBOARD]
+        query += (
+            f" UNION ALL SELECT {', '.join(colunas)} FROM historico_precos WHERE " + " AND ".join(where_na_data)
+        )
+        params += [f"{date_start.isoformat()} 00:00:00", *params_na_data]
+    return query, params
+
+def load_archive(date_start, date_end, categoria, disponibilidade, promocao):
+    """
+    Observações arquivadas em Parquet pelo coletor (app.py --exportar-parquet), lendo só os
+    meses do período e só as colunas do dashboard. Retorna (df, ate), em que `ate` é a última
+    data_coleta arquivada, ou (None, None) se não houver arquivo ou pyarrow.
+    """
+    try:
+        import pyarrow.dataset as ds
+        with open(os.path.join(ARQUIVO_DIR, "_manifesto.json"), encoding="utf-8") as f:
+            ate = json.load(f)['ate']
+    except (ImportError, OSError, ValueError, KeyError):
+        return None, None
+
+    filtro = ds.field('data_coleta') <= ate
+    if date_start is not None:
+        filtro &= (ds.field('mes') >= date_start.isoformat()[:7]) & (ds.field('data_coleta') >= date_start.isoformat())
+    if date_end is not None:
+        fim = (date_end + timedelta(days=1)).isoformat()
+        filtro &= (ds.field('mes') <= date_end.isoformat()[:7]) & (ds.field('data_coleta') < fim)
+    if categoria != "Todas":
+        filtro &= ds.field('categoria') == categoria
+    if disponibilidade != "Todos":
+        filtro &= ds.field('disponivel') == int(disponibilidade == "Disponível")
+    if promocao != "Todos":
+        filtro &= ds.field('em_promocao') == int(promocao == "Em Promoção")
+
+    dataset = ds.dataset(ARQUIVO_DIR, format="parquet", partitioning="hive")
+    df = dataset.to_table(columns=COLUNAS_DASHBOARD, filter=filtro).to_pandas()
+    datas = df['data_coleta']
+    if isinstance(datas.dtype, pd.CategoricalDtype):
+        # Arquivos de versões anteriores gravavam as datas em dicionário: converte só os valores distintos
+        df['data_coleta'] = pd.to_datetime(datas.cat.categories).take(datas.cat.codes)
+    else:
+        df['data_coleta'] = pd.to_datetime(datas)
+    return df, ate
+
+def concat_history(arquivado, recente):
+    """Junta o histórico arquivado (texto em colunas categóricas) ao lido do SQLite, mantendo as categorias"""
+    if recente.empty:
+        return arquivado
+    df = pd.concat([arquivado, recente], ignore_index=True)
+    for coluna in arquivado.select_dtypes('category').columns:
+        df[coluna] = union_categoricals(
+            [arquivado[coluna], recente[coluna].astype(arquivado[coluna].cat.categories.dtype).astype('category')],
+            ignore_order=True
+        )
+    return df
+
+@st.cache_data(ttl=60, max_entries=20) # Um cache por combinação de filtros, renovado a cada minuto
+def load_data(date_start=None, date_end=None, categoria="Todas", disponibilidade="Todos", promocao="Todos",
+              ocultar_incompletas=True):
+    try:
+        # Observações antigas vêm do arquivo Parquet (se houver); o restante, do SQLite
+        arquivado, arquivado_ate = load_archive(date_start, date_end, categoria, disponibilidade, promocao)
+        conn = sqlite3.connect(DB_NAME)
+        query, params = build_query(date_start, date_end, categoria, disponibilidade, promocao, ocultar_incompletas,
+                                    arquivado_ate)
+        df = pd.read_sql_query(query, conn, params=params)
         conn.close()
         
         # Conversão de tipos
@@ -28,57 +205,255 @@ def load_data():
         df['preco_atual'] = pd.to_numeric(df['preco_atual'], errors='coerce')
         df['preco_original'] = pd.to_numeric(df['preco_original'], errors='coerce')
         
+        if arquivado is not None:
+            df = concat_history(arquivado, df)
         return df
     except Exception as e:
         st.error(f"Erro ao carregar dados: {e}")
         return pd.DataFrame()
 
+@st.cache_data(ttl=60)
+def load_latest_state(date_start, categoria="Todas", disponibilidade="Todos", promocao="Todos",
+                      ocultar_incompletas=True):
+    """
+    Último registro de cada SKU lido de estado_atual (mantida pelo coletor), sem percorrer
+    o histórico. estado_atual muda a cada lote, então, com `ocultar_incompletas`, os SKUs
+    gravados por uma execução ainda não concluída voltam ao último registro de uma execução
+    concluída, lido de historico_precos. Retorna None se a tabela não estiver disponível.
+    """
+    where, params = filter_clauses(categoria, disponibilidade, promocao)
+    where.append("data_coleta >= ?")
+    params.append(date_start.isoformat())
+    incompletas = "SELECT data_coleta FROM execucoes WHERE status <> 'concluida'"
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        afetados = ocultar_incompletas and conn.execute(
+            f"SELECT 1 FROM estado_atual WHERE data_coleta IN ({incompletas}) LIMIT 1"
+        ).fetchone()
+        query = f"SELECT {', '.join(COLUNAS_DASHBOARD)} FROM estado_atual WHERE " + " AND ".join(where)
+        if afetados:
+            query += (
+                f" AND data_coleta NOT IN ({incompletas})"
+                f" UNION ALL SELECT {', '.join(COLUNAS_DASHBOARD)} FROM ("
+                f"SELECT *, ROW_NUMBER() OVER (PARTITION BY sku ORDER BY data_coleta DESC) AS ordem"
+                f" FROM historico_precos WHERE data_coleta NOT IN ({incompletas})"
+                f" AND url IN (SELECT url FROM estado_atual WHERE data_coleta IN ({incompletas}))"
+                ") WHERE ordem = 1 AND " + " AND ".join(where)
+            )
+            params = params * 2
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+    except Exception:
+        return None
+
+    df['data_coleta'] = pd.to_datetime(df['data_coleta'])
+    return df
+
+@st.cache_data(ttl=60)
+def load_daily_aggregates(dia_inicio, dia_limite, categoria="Todas", disponibilidade="Todos", promocao="Todos",
+                          ocultar_incompletas=True):
+    """
+    Contagens por categoria/disponibilidade/promoção pré-calculadas pelo coletor, do último
+    dia com coleta entre `dia_inicio` e `dia_limite`. DataFrame vazio se não houver agregados
+    para o período ou se, com `ocultar_incompletas`, eles incluírem uma execução não concluída
+    (do período ou ainda presente em estado_atual); aí as contagens saem de aggregate_snapshot.
+    """
+    where, params = filter_clauses(categoria, disponibilidade, promocao)
+    where.insert(0, "dia = (SELECT MAX(dia) FROM agregados_diarios WHERE dia >= ? AND dia <= ?)")
+    params[:0] = [dia_inicio.isoformat(), dia_limite.isoformat()]
+    if ocultar_incompletas:
+        where.append(
+            "NOT EXISTS (SELECT 1 FROM execucoes WHERE status <> 'concluida' AND date(data_coleta) <= ?"
+            " AND (date(data_coleta) >= ? OR data_coleta IN (SELECT data_coleta FROM estado_atual)))"
+        )
+        params += [dia_limite.isoformat(), dia_inicio.isoformat()]
+    query = f"SELECT {', '.join(COLUNAS_AGREGADOS)} FROM agregados_diarios WHERE " + " AND ".join(where)
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+    except Exception:
+        return pd.DataFrame()
+
+@st.cache_data(ttl=60)
+def load_run_metrics():
+    """Telemetria das execuções do coletor (tabela run_metrics). DataFrame vazio se não houver."""
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        df = pd.read_sql_query("SELECT * FROM run_metrics ORDER BY id", conn)
+        conn.close()
+    except Exception:
+        return pd.DataFrame()
+
+    df['data_coleta'] = pd.to_datetime(df['data_coleta'])
+    df['taxa_erro'] = (df['erros_requisicao'] / df['requisicoes'].where(df['requisicoes'] > 0) * 100).fillna(0)
+    return df
+
+@st.cache_data(ttl=60, max_entries=50)
+def load_change_events(filtros, tipos, pagina, variacao_minima=None):
+    """
+    Uma página (mais recentes primeiro) dos eventos de mudança que o coletor grava em
+    change_events, no período e na categoria dos filtros. Retorna (df, total de eventos), ou
+    (None, 0) se a tabela não estiver disponível.
+    """
+    date_start, date_end, categoria, _, _, ocultar_incompletas = filtros
+    where = [f"e.tipo IN ({', '.join('?' * len(tipos))})", "e.data_coleta >= ?", "e.data_coleta < ?"]
+    params = [*tipos, date_start.isoformat(), (date_end + timedelta(days=1)).isoformat()]
+    if categoria != "Todas":
+        where.append("p.categoria = ?")
+        params.append(categoria)
+    if variacao_minima is not None:
+        where.append("ABS(e.variacao_pct) > ?")
+        params.append(variacao_minima)
+    if ocultar_incompletas:
+        where.append("e.data_coleta NOT IN (SELECT data_coleta FROM execucoes WHERE status <> 'concluida')")
+    base = "FROM change_events e JOIN produtos p ON p.id = e.produto_id WHERE " + " AND ".join(where)
+
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        df = pd.read_sql_query(
+            "SELECT e.data_coleta, p.produto_nome, p.sku, p.categoria, e.tipo, e.preco_anterior, e.preco_novo, "
+            f"e.variacao_pct {base} ORDER BY e.data_coleta DESC, e.id DESC LIMIT ? OFFSET ?",
+            conn, params=[*params, ALERTAS_POR_PAGINA, (pagina - 1) * ALERTAS_POR_PAGINA]
+        )
+        conn.close()
+    except Exception:
+        return None, 0
+
+    df['data_coleta'] = pd.to_datetime(df['data_coleta'])
+    return df, total
+
+def search_query(texto):
+    """
+    Converte o texto digitado numa consulta FTS5: cada palavra vira um prefixo entre aspas,
+    todas obrigatórias. Pontuação e operadores do FTS5 não passam, então a consulta é sempre válida.
+    """
+    return " ".join(f'"{palavra}"*' for palavra in re.findall(r"\w+", texto))
+
+@st.cache_data(ttl=60, max_entries=100)
+def search_products(texto, limite=BUSCA_MAX_RESULTADOS):
+    """
+    Produtos cujo nome, tags, SKU ou categoria casam com o texto (sem acentos, por prefixo),
+    ordenados pela relevância (bm25, com mais peso no nome e no SKU), com o estado mais recente.
+    Retorna None se o índice de busca (mantido pelo coletor) não estiver disponível.
+    """
+    consulta = search_query(texto)
+    if not consulta:
+        return pd.DataFrame()
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        df = pd.read_sql_query('''
+            SELECT p.id, p.produto_nome, p.sku, p.categoria, o.preco_atual, o.em_promocao, o.disponivel, p.ultima_coleta
+            FROM busca_produtos b
+            JOIN produtos p ON p.id = b.rowid
+            JOIN observacoes o ON o.id = (SELECT MAX(id) FROM observacoes WHERE produto_id = p.id)
+            WHERE busca_produtos MATCH ?
+            ORDER BY bm25(busca_produtos, 10.0, 2.0, 5.0, 1.0)
+            LIMIT ?
+        ''', conn, params=(consulta, limite))
+        conn.close()
+    except Exception:
+        return None
+
+    df['ultima_coleta'] = pd.to_datetime(df['ultima_coleta'])
+    return df
+
+@st.cache_data(ttl=60, max_entries=50)
+def load_product_history(produto_id):
+    """
+    Histórico de um único produto, pelo índice (produto_id, data_coleta): as observações, mais o
+    estado vigente na última verificação (como em historico_precos), e os eventos de mudança.
+    """
+    conn = sqlite3.connect(DB_NAME)
+    df = pd.read_sql_query('''
+        SELECT data_coleta, preco_original, preco_atual, em_promocao, disponivel, metodo_verificacao
+        FROM observacoes
+        WHERE produto_id = ?
+        ORDER BY data_coleta
+    ''', conn, params=(produto_id,))
+    ultima_coleta = conn.execute("SELECT ultima_coleta FROM produtos WHERE id = ?", (produto_id,)).fetchone()[0]
+    try:
+        eventos = pd.read_sql_query('''
+            SELECT data_coleta, tipo, preco_anterior, preco_novo, variacao_pct
+            FROM change_events
+            WHERE produto_id = ?
+            ORDER BY data_coleta DESC, id DESC
+        ''', conn, params=(produto_id,))
+    except Exception:
+        eventos = pd.DataFrame()
+    conn.close()
+
+    if not df.empty and ultima_coleta and ultima_coleta > df['data_coleta'].iloc[-1]:
+        df = pd.concat([df, df.tail(1).assign(data_coleta=ultima_coleta)], ignore_index=True)
+    df['data_coleta'] = pd.to_datetime(df['data_coleta'])
+    if not eventos.empty:
+        eventos['data_coleta'] = pd.to_datetime(eventos['data_coleta'])
+        eventos['tipo'] = eventos['tipo'].map(NOMES_EVENTO)
+    return df, eventos
+
 # --- FUNÇÕES DE ANÁLISE ---
+def aggregate_snapshot(df_latest):
+    """Mesmo formato de agregados_diarios, calculado a partir do último registro de cada SKU"""
+    if df_latest.empty:
+        return pd.DataFrame(columns=COLUNAS_AGREGADOS)
+    em_promocao = df_latest['em_promocao'] == 1
+    desconto = (df_latest['preco_original'] - df_latest['preco_atual']) / df_latest['preco_original'] * 100
+    return (
+        df_latest.assign(soma_desconto_pct=desconto.where(em_promocao & (df_latest['preco_original'] > 0), 0))
+        .groupby(['categoria', 'disponivel', 'em_promocao'], as_index=False, observed=True)
+        .agg(
+            total_produtos=('sku', 'size'),
+            soma_preco=('preco_atual', 'sum'),
+            soma_desconto_pct=('soma_desconto_pct', 'sum')
+        )
+    )
+
+def first_and_last_records(df):
+    """
+    Primeiro e último registro de cada SKU (com 2+ coletas), lado a lado, numa única passada:
+    ordena uma vez e usa drop_duplicates em vez de filtrar o DataFrame SKU a SKU.
+    """
+    df_sorted = df[df['sku'].notna()].sort_values(['sku', 'data_coleta'], kind='stable')
+    counts = df_sorted['sku'].value_counts()
+    df_sorted = df_sorted[df_sorted['sku'].map(counts) >= 2]
+
+    first = df_sorted.drop_duplicates(subset='sku', keep='first').set_index('sku')
+    last = df_sorted.drop_duplicates(subset='sku', keep='last').set_index('sku')
+    return first, last
+
 def calculate_price_changes(df):
-    """Calcula variações de preço entre coletas para cada SKU"""
+    """Calcula variações de preço entre a primeira e a última coleta de cada SKU"""
     if df.empty:
         return pd.DataFrame()
     
-    # Ordenar por SKU e data
-    df_sorted = df.sort_values(['sku', 'data_coleta'])
-    
-    # Para cada SKU, calcular a diferença entre primeira e última coleta
-    price_changes = []
-    for sku in df_sorted['sku'].unique():
-        sku_data = df_sorted[df_sorted['sku'] == sku]
-        if len(sku_data) < 2:
-            continue
-            
-        first_record = sku_data.iloc[0]
-        last_record = sku_data.iloc[-1]
-        
-        price_diff = last_record['preco_atual'] - first_record['preco_atual']
-        price_pct = (price_diff / first_record['preco_atual'] * 100) if first_record['preco_atual'] > 0 else 0
-        
-        price_changes.append({
-            'sku': sku,
-            'produto_nome': last_record['produto_nome'],
-            'categoria': last_record['categoria'],
-            'preco_inicial': first_record['preco_atual'],
-            'preco_final': last_record['preco_atual'],
-            'variacao_absoluta': price_diff,
-            'variacao_percentual': price_pct,
-            'data_inicial': first_record['data_coleta'],
-            'data_final': last_record['data_coleta']
-        })
-    
-    return pd.DataFrame(price_changes)
+    first, last = first_and_last_records(df)
+    if first.empty:
+        return pd.DataFrame()
+
+    price_diff = last['preco_atual'] - first['preco_atual']
+    price_pct = (price_diff / first['preco_atual'] * 100).where(first['preco_atual'] > 0, 0)
+
+    return pd.DataFrame({
+        'produto_nome': last['produto_nome'],
+        'categoria': last['categoria'],
+        'preco_inicial': first['preco_atual'],
+        'preco_final': last['preco_atual'],
+        'variacao_absoluta': price_diff,
+        'variacao_percentual': price_pct,
+        'data_inicial': first['data_coleta'],
+        'data_final': last['data_coleta']
+    }).rename_axis('sku').reset_index()
 
-def get_top_price_drops(df, n=10):
-    """Retorna os N produtos com maior queda de preço"""
-    changes = calculate_price_changes(df)
+def get_top_price_drops(changes, n=10):
+    """Retorna os N produtos com maior queda de preço (a partir de calculate_price_changes)"""
     if changes.empty:
         return pd.DataFrame()
     return changes.nsmallest(n, 'variacao_percentual')
 
-def get_top_price_increases(df, n=10):
-    """Retorna os N produtos com maior aumento de preço"""
-    changes = calculate_price_changes(df)
+def get_top_price_increases(changes, n=10):
+    """Retorna os N produtos com maior aumento de preço (a partir de calculate_price_changes)"""
     if changes.empty:
         return pd.DataFrame()
     return changes.nlargest(n, 'variacao_percentual')
@@ -88,49 +463,106 @@ def get_availability_changes(df):
     if df.empty:
         return pd.DataFrame()
     
-    df_sorted = df.sort_values(['sku', 'data_coleta'])
-    availability_changes = []
-    
-    for sku in df_sorted['sku'].unique():
-        sku_data = df_sorted[df_sorted['sku'] == sku]
-        if len(sku_data) < 2:
-            continue
-            
-        first_record = sku_data.iloc[0]
-        last_record = sku_data.iloc[-1]
-        
-        if first_record['disponivel'] != last_record['disponivel']:
-            availability_changes.append({
-                'sku': sku,
-                'produto_nome': last_record['produto_nome'],
-                'status_anterior': 'Disponível' if first_record['disponivel'] == 1 else 'Indisponível',
-                'status_atual': 'Disponível' if last_record['disponivel'] == 1 else 'Indisponível',
-                'data_mudanca': last_record['data_coleta']
-            })
-    
-    return pd.DataFrame(availability_changes)
-
-def calculate_promotion_metrics(df_latest):
-    """Calcula métricas agregadas sobre promoções"""
-    if df_latest.empty:
+    first, last = first_and_last_records(df)
+    changed = first['disponivel'] != last['disponivel']
+    if not changed.any():
+        return pd.DataFrame()
+
+    first, last = first[changed], last[changed]
+    status = {1: 'Disponível', 0: 'Indisponível'}
+    return pd.DataFrame({
+        'produto_nome': last['produto_nome'],
+        'status_anterior': (first['disponivel'] == 1).map({True: status[1], False: status[0]}),
+        'status_atual': (last['disponivel'] == 1).map({True: status[1], False: status[0]}),
+        'data_mudanca': last['data_coleta']
+    }).rename_axis('sku').reset_index()
+
+def collapse_steps(df, coluna='preco_atual'):
+    """
+    Remove as observações que repetem o preço anterior do mesmo produto, mantendo a primeira
+    de cada patamar e a última do produto (o degrau vai até a última coleta).
+    """
+    df = df.sort_values(['produto_nome', 'data_coleta'], kind='stable')
+    produto = df['produto_nome']
+    inicio = produto.ne(produto.shift())
+    fim = produto.ne(produto.shift(-1))
+    return df[inicio | fim | df[coluna].ne(df[coluna].shift())]
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: índices de `n_out` pontos que preservam a forma da série"""
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 baldes entre o primeiro e o último ponto, que sempre ficam
+    bordas = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = [0]
+    a = 0
+    for i in range(n_out - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        proximo = slice(bordas[i + 1], bordas[i + 2]) if i + 2 < len(bordas) else slice(n - 1, n)
+        mx, my = x[proximo].mean(), y[proximo].mean()
+        # Ponto do balde que forma o maior triângulo com o escolhido antes e a média do próximo balde
+        areas = np.abs((x[a] - mx) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (my - y[a]))
+        a = inicio + int(np.nanargmax(areas)) if not np.isnan(areas).all() else inicio
+        indices.append(a)
+    indices.append(n - 1)
+    return np.array(indices)
+
+def minmax_indices(x, y, n_out):
+    """Baldes de tempo iguais; de cada um ficam o menor e o maior preço, então nenhum pico some"""
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    n_baldes = max(1, n_out // 2)
+    span = (x[-1] - x[0]) or 1
+    balde = np.minimum(((x - x[0]) / span * n_baldes).astype(int), n_baldes - 1)
+    ordem = np.lexsort((y, balde))
+    b = balde[ordem]
+    troca = b[1:] != b[:-1]
+    primeiros = ordem[np.r_[True, troca]]
+    ultimos = ordem[np.r_[troca, True]]
+    return np.unique(np.concatenate([primeiros, ultimos, [0, n - 1]]))
+
+def downsample_history(df, max_pontos=MAX_PONTOS_SERIE):
+    """
+    Série de preços por produto pronta para os gráficos: colapsa preços repetidos em degraus
+    e, se algum produto ainda passar de `max_pontos`, reduz por LTTB quando o período visível
+    é curto (até LTTB_MAX_DIAS) ou por baldes de mínimo/máximo quando é longo.
+    """
+    if df.empty:
+        return df
+    df = collapse_steps(df)
+    dias = (df['data_coleta'].max() - df['data_coleta'].min()).days
+    reduzir = lttb_indices if dias <= LTTB_MAX_DIAS else minmax_indices
+
+    partes = []
+    for _, serie in df.groupby('produto_nome', observed=True, sort=False):
+        if len(serie) > max_pontos:
+            x = serie['data_coleta'].to_numpy().astype('int64').astype(float)
+            y = serie['preco_atual'].to_numpy(dtype=float)
+            serie = serie.iloc[reduzir(x, y, max_pontos)]
+        partes.append(serie)
+    return pd.concat(partes)
+
+def calculate_promotion_metrics(snapshot):
+    """Calcula métricas agregadas sobre promoções a partir das contagens de agregados_diarios"""
+    if snapshot.empty:
         return {}
     
-    total_products = len(df_latest)
-    promo_products = len(df_latest[df_latest['em_promocao'] == 1])
+    total_products = int(snapshot['total_produtos'].sum())
+    promo_df = snapshot[snapshot['em_promocao'] == 1]
+    promo_products = int(promo_df['total_produtos'].sum())
     promo_percentage = (promo_products / total_products * 100) if total_products > 0 else 0
+    avg_price = snapshot['soma_preco'].sum() / total_products if total_products > 0 else 0
     
-    # Calcular desconto médio
-    promo_df = df_latest[df_latest['em_promocao'] == 1].copy()
-    if not promo_df.empty:
-        promo_df['desconto_pct'] = ((promo_df['preco_original'] - promo_df['preco_atual']) / promo_df['preco_original'] * 100)
-        avg_discount = promo_df['desconto_pct'].mean()
-    else:
-        avg_discount = 0
+    # Desconto médio
+    avg_discount = promo_df['soma_desconto_pct'].sum() / promo_products if promo_products > 0 else 0
     
     # Categoria com mais promoções
-    if not promo_df.empty:
-        top_promo_category = promo_df['categoria'].value_counts().index[0]
-        top_promo_count = promo_df['categoria'].value_counts().iloc[0]
+    if promo_products > 0:
+        promo_by_cat = promo_df.groupby('categoria')['total_produtos'].sum()
+        top_promo_category = promo_by_cat.idxmax()
+        top_promo_count = int(promo_by_cat.max())
     else:
         top_promo_category = "N/A"
         top_promo_count = 0
@@ -139,11 +571,97 @@ def calculate_promotion_metrics(df_latest):
         'total_products': total_products,
         'promo_products': promo_products,
         'promo_percentage': promo_percentage,
+        'avg_price': avg_price,
         'avg_discount': avg_discount,
         'top_promo_category': top_promo_category,
         'top_promo_count': top_promo_count
     }
 
+# --- SEÇÕES EM CACHE ---
+# Cada seção é calculada uma vez por combinação de filtros (`filtros` = argumentos de load_data,
+# na mesma ordem). Reexecuções que não mudam os filtros reaproveitam os resultados em vez de
+# refazer as análises, e a tabela detalhada roda num fragmento próprio.
+@st.cache_data(ttl=60, max_entries=20)
+def history_analytics(filtros):
+    """
+    Análises sobre o histórico filtrado: total de registros, variações e a série dos top 5
+    produtos, já reduzida para o gráfico.
+    """
+    df = load_data(*filtros)
+    if df.empty:
+        return {'total_registros': 0}
+
+    # Top 5 produtos mais frequentes no filtro, para não poluir o gráfico de evolução
+    top_products = df['produto_nome'].value_counts().head(5).index
+    return {
+        'total_registros': len(df),
+        'price_changes': calculate_price_changes(df),
+        'price_history': downsample_history(df[df['produto_nome'].isin(top_products)]),
+    }
+
+@st.cache_data(ttl=60, max_entries=20)
+def history_alerts(filtros):
+    """
+    Alertas recalculados a partir do histórico (primeira x última coleta de cada SKU), para
+    bancos que ainda não têm change_events.
+    """
+    price_changes = history_analytics(filtros)['price_changes']
+    significant_changes = pd.DataFrame()
+    if not price_changes.empty:
+        significant_changes = price_changes[
+            (price_changes['variacao_percentual'] > 10) | (price_changes['variacao_percentual'] < -10)
+        ].copy()
+        significant_changes['variacao_formatada'] = significant_changes['variacao_percentual'].apply(
+            lambda x: f"{x:+.1f}%"
+        )
+    return get_availability_changes(load_data(*filtros)), significant_changes
+
+@st.cache_data(ttl=60, max_entries=20)
+def latest_snapshot(filtros, max_date):
+    """
+    Registro mais recente de cada SKU até `date_end` e contagens agregadas desse mesmo retrato.
+    Se o período chega à última coleta, vêm prontos das tabelas mantidas pelo coletor; para
+    recortes no passado, são calculados a partir do histórico do período.
+    """
+    date_start, date_end, categoria, disponibilidade, promocao, ocultar_incompletas = filtros
+    df_latest = None
+    if date_end >= max_date:
+        df_latest = load_latest_state(date_start, categoria, disponibilidade, promocao, ocultar_incompletas)
+    if df_latest is None:
+        # Disponibilidade e promoção filtram o estado na data final, não registros antigos do período
+        df = load_data(date_start, date_end, categoria, "Todos", "Todos", ocultar_incompletas)
+        df_latest = df.sort_values(by="data_coleta", ascending=False).drop_duplicates(subset="sku", keep="first")
+        if disponibilidade != "Todos":
+            df_latest = df_latest[df_latest['disponivel'] == int(disponibilidade == "Disponível")]
+        if promocao != "Todos":
+            df_latest = df_latest[df_latest['em_promocao'] == int(promocao == "Em Promoção")]
+        return df_latest, aggregate_snapshot(df_latest)
+
+    # Os agregados contam todo o estado_atual, inclusive SKUs que saíram do catálogo antes do
+    # período: só valem quando cobrem exatamente os SKUs de df_latest (um subconjunto deles)
+    snapshot = load_daily_aggregates(date_start, date_end, categoria, disponibilidade, promocao, ocultar_incompletas)
+    if snapshot.empty or snapshot['total_produtos'].sum() != len(df_latest):
+        snapshot = aggregate_snapshot(df_latest)
+    return df_latest, snapshot
+
+@st.cache_data(ttl=60, max_entries=50)
+def detail_rows(filtros, max_date, view_option, num_rows):
+    """Linhas mais recentes da tabela detalhada, já formatadas"""
+    if view_option == "Última Coleta (SKU Único)":
+        display_df, _ = latest_snapshot(filtros, max_date)
+    else:
+        display_df = load_data(*filtros)
+    total = len(display_df)
+
+    columns_to_show = [
+        'data_coleta', 'produto_nome', 'sku', 'categoria', 
+        'preco_atual', 'preco_original', 'em_promocao', 'disponivel'
+    ]
+    display_df_formatted = display_df.nlargest(num_rows, 'data_coleta')[columns_to_show].copy()
+    display_df_formatted['em_promocao'] = display_df_formatted['em_promocao'].map({1: '✅', 0: '❌'})
+    display_df_formatted['disponivel'] = display_df_formatted['disponivel'].map({1: '✅', 0: '❌'})
+    return display_df_formatted, total
+
 def export_to_csv(df):
     """Exporta dados para CSV e retorna o conteúdo"""
     return df.to_csv(index=False).encode('utf-8')
@@ -152,35 +670,32 @@ def main():
     st.title("🦚 Dashboard de Monitoramento - Pavão")
     st.markdown("Visualize o histórico de preços e disponibilidade dos produtos.")
 
-    # Carregar dados
-    df = load_data()
+    # Limites dos filtros (consulta leve, sem carregar o histórico)
+    filter_options = load_filter_options()
 
-    if df.empty:
+    if filter_options is None:
         st.warning("Nenhum dado encontrado no banco de dados.")
         return
 
+    min_date, max_date, categorias = filter_options
+
     # --- SIDEBAR (FILTROS) ---
     st.sidebar.header("Filtros")
     
     # Filtro de Período
-    if not df.empty:
-        min_date = df['data_coleta'].min().date()
-        max_date = df['data_coleta'].max().date()
-        
-        date_range = st.sidebar.date_input(
-            "Período de Análise",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date
-        )
-        
-        # Aplicar filtro de data
-        if isinstance(date_range, tuple) and len(date_range) == 2:
-            df = df[(df['data_coleta'].dt.date >= date_range[0]) & (df['data_coleta'].dt.date <= date_range[1])]
+    date_range = st.sidebar.date_input(
+        "Período de Análise",
+        value=(min_date, max_date),
+        min_value=min_date,
+        max_value=max_date
+    )
+    if isinstance(date_range, tuple) and len(date_range) == 2:
+        date_start, date_end = date_range
+    else:
+        date_start, date_end = min_date, max_date
     
     # Filtro de Categoria
-    categorias = ["Todas"] + sorted(df['categoria'].unique().tolist())
-    cat_filter = st.sidebar.selectbox("Categoria", categorias)
+    cat_filter = st.sidebar.selectbox("Categoria", ["Todas"] + categorias)
     
     # Filtro de Disponibilidade
     disp_options = ["Todos", "Disponível", "Indisponível"]
@@ -190,12 +705,23 @@ def main():
     promo_options = ["Todos", "Em Promoção", "Preço Normal"]
     promo_filter = st.sidebar.selectbox("Status de Promoção", promo_options)
     
+    # Execuções interrompidas
+    hide_incomplete = st.sidebar.checkbox(
+        "Ocultar coletas incompletas",
+        value=True,
+        help="Ignora registros de execuções do coletor que ainda não terminaram (interrompidas ou em andamento)"
+    )
+    
+    # Chave das seções em cache; os dados só são carregados (filtros aplicados no SQL) quando
+    # alguma seção ainda não foi calculada para esta combinação
+    filtros = (date_start, date_end, cat_filter, disp_filter, promo_filter, hide_incomplete)
+    
     st.sidebar.divider()
     
     # Exportação de Dados
     st.sidebar.header("📥 Exportar Dados")
     if st.sidebar.button("Baixar CSV Filtrado", use_container_width=True):
-        csv_data = export_to_csv(df)
+        csv_data = export_to_csv(load_data(*filtros))
         st.sidebar.download_button(
             label="⬇️ Download CSV",
             data=csv_data,
@@ -204,42 +730,36 @@ def main():
             use_container_width=True
         )
 
+    aba_precos, aba_busca, aba_coletor = st.tabs(["💰 Preços e Estoque", "🔎 Buscar Produto", "⚙️ Execuções do Coletor"])
+    with aba_precos:
+        show_prices(filtros, max_date)
+    with aba_busca:
+        show_product_search()
+    with aba_coletor:
+        show_run_metrics()
 
-    # Aplicar Filtros
-    df_filtered = df.copy()
-    
-    if cat_filter != "Todas":
-        df_filtered = df_filtered[df_filtered['categoria'] == cat_filter]
-        
-    if disp_filter == "Disponível":
-        df_filtered = df_filtered[df_filtered['disponivel'] == 1]
-    elif disp_filter == "Indisponível":
-        df_filtered = df_filtered[df_filtered['disponivel'] == 0]
-        
-    if promo_filter == "Em Promoção":
-        df_filtered = df_filtered[df_filtered['em_promocao'] == 1]
-    elif promo_filter == "Preço Normal":
-        df_filtered = df_filtered[df_filtered['em_promocao'] == 0]
+def show_prices(filtros, max_date):
+    analytics = history_analytics(filtros)
+    if analytics['total_registros'] == 0:
+        st.info("Nenhum registro encontrado para os filtros selecionados.")
+        return
 
     # --- PREPARAÇÃO DOS DADOS (SKU ÚNICO) ---
-    # Para análises de distribuição e KPIs, queremos apenas o registro mais recente de cada SKU
-    df_latest = df_filtered.sort_values(by="data_coleta", ascending=False).drop_duplicates(subset="sku", keep="first")
+    # Para análises de distribuição e KPIs, queremos apenas o registro mais recente de cada SKU.
+    df_latest, snapshot = latest_snapshot(filtros, max_date)
 
     # --- KPIs (TOPO) ---
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     
-    total_produtos = df_latest['sku'].nunique()
-    total_registros = len(df_filtered) # Mantém o total de registros histórico
-    media_preco = df_latest['preco_atual'].mean()
-    qtd_promo = df_latest[df_latest['em_promocao'] == 1]['sku'].nunique()
-    
     # Métricas de promoção
-    promo_metrics = calculate_promotion_metrics(df_latest)
+    promo_metrics = calculate_promotion_metrics(snapshot)
+    
+    total_registros = analytics['total_registros'] # Mantém o total de registros histórico
     
-    col1.metric("Produtos Únicos", total_produtos)
+    col1.metric("Produtos Únicos", promo_metrics.get('total_products', 0))
     col2.metric("Total de Registros", total_registros)
-    col3.metric("Preço Médio", f"R$ {media_preco:.2f}")
-    col4.metric("Em Promoção", qtd_promo)
+    col3.metric("Preço Médio", f"R$ {promo_metrics.get('avg_price', 0):.2f}")
+    col4.metric("Em Promoção", promo_metrics.get('promo_products', 0))
     col5.metric("% em Promoção", f"{promo_metrics.get('promo_percentage', 0):.1f}%")
     col6.metric("Desconto Médio", f"{promo_metrics.get('avg_discount', 0):.1f}%")
 
@@ -248,11 +768,14 @@ def main():
     # --- ANÁLISE DE TENDÊNCIAS ---
     st.header("📊 Análise de Tendências")
     
+    # Calculado uma vez e compartilhado entre quedas e aumentos
+    price_changes = analytics['price_changes']
+    
     col_trend1, col_trend2 = st.columns(2)
     
     with col_trend1:
         st.subheader("🔻 Maiores Quedas de Preço")
-        top_drops = get_top_price_drops(df_filtered, n=5)
+        top_drops = get_top_price_drops(price_changes, n=5)
         if not top_drops.empty:
             for idx, row in top_drops.iterrows():
                 with st.expander(f"{row['produto_nome'][:50]}... ({row['variacao_percentual']:.1f}%)"):
@@ -266,7 +789,7 @@ def main():
     
     with col_trend2:
         st.subheader("🔺 Maiores Aumentos de Preço")
-        top_increases = get_top_price_increases(df_filtered, n=5)
+        top_increases = get_top_price_increases(price_changes, n=5)
         if not top_increases.empty:
             for idx, row in top_increases.iterrows():
                 with st.expander(f"{row['produto_nome'][:50]}... (+{row['variacao_percentual']:.1f}%)"):
@@ -281,35 +804,7 @@ def main():
     st.divider()
     
     # --- SISTEMA DE ALERTAS ---
-    st.header("🚨 Alertas e Mudanças Importantes")
-    
-    # Mudanças de disponibilidade
-    availability_changes = get_availability_changes(df_filtered)
-    if not availability_changes.empty:
-        st.subheader("📦 Mudanças de Disponibilidade")
-        st.dataframe(
-            availability_changes[['produto_nome', 'sku', 'status_anterior', 'status_atual', 'data_mudanca']],
-            use_container_width=True,
-            hide_index=True
-        )
-    
-    # Produtos com variação significativa (>10% ou <-10%)
-    all_changes = calculate_price_changes(df_filtered)
-    if not all_changes.empty:
-        significant_changes = all_changes[
-            (all_changes['variacao_percentual'] > 10) | (all_changes['variacao_percentual'] < -10)
-        ].copy()
-        
-        if not significant_changes.empty:
-            st.subheader("💰 Variações Significativas de Preço (>10%)")
-            significant_changes['variacao_formatada'] = significant_changes['variacao_percentual'].apply(
-                lambda x: f"{x:+.1f}%"
-            )
-            st.dataframe(
-                significant_changes[['produto_nome', 'categoria', 'preco_inicial', 'preco_final', 'variacao_formatada']],
-                use_container_width=True,
-                hide_index=True
-            )
+    show_alerts(filtros)
 
     st.divider()
 
@@ -333,18 +828,25 @@ def main():
 
     with col_chart2:
         st.subheader("Disponibilidade")
-        disp_counts = df_latest['disponivel'].value_counts().rename({1: 'Disponível', 0: 'Indisponível'})
-        fig_pie = px.pie(
-            values=disp_counts.values, 
-            names=disp_counts.index, 
-            title="Proporção de Disponibilidade",
-            color_discrete_sequence=['#2ecc71', '#e74c3c']
-        )
-        st.plotly_chart(fig_pie, use_container_width=True)
+        if not snapshot.empty:
+            disp_counts = snapshot.groupby('disponivel')['total_produtos'].sum().rename({1: 'Disponível', 0: 'Indisponível'})
+            fig_pie = px.pie(
+                values=disp_counts.values, 
+                names=disp_counts.index, 
+                title="Proporção de Disponibilidade",
+                color_discrete_sequence=['#2ecc71', '#e74c3c']
+            )
+            st.plotly_chart(fig_pie, use_container_width=True)
+        else:
+            st.info("Nenhum produto na última coleta com os filtros atuais")
     
     with col_chart3:
         st.subheader("Promoções por Categoria")
-        promo_by_cat = df_latest[df_latest['em_promocao'] == 1].groupby('categoria').size().reset_index(name='count')
+        promo_by_cat = (
+            snapshot[snapshot['em_promocao'] == 1]
+            .groupby('categoria')['total_produtos'].sum()
+            .reset_index(name='count')
+        )
         if not promo_by_cat.empty:
             fig_bar = px.bar(
                 promo_by_cat.nlargest(10, 'count'),
@@ -361,9 +863,8 @@ def main():
     # --- EVOLUÇÃO TEMPORAL (LINHA) ---
     st.subheader("📉 Evolução de Preços ao Longo do Tempo")
     
-    # Pegar os top 5 produtos mais frequentes no filtro para não poluir o gráfico
-    top_products = df_filtered['produto_nome'].value_counts().head(5).index
-    df_line = df_filtered[df_filtered['produto_nome'].isin(top_products)]
+    # Top 5 produtos mais frequentes no filtro, para não poluir o gráfico
+    df_line = analytics['price_history']
     
     if not df_line.empty and len(df_line) > 1:
         fig_line = px.line(
@@ -373,7 +874,8 @@ def main():
             color="produto_nome", 
             title="Histórico de Preços (Top 5 Produtos)",
             labels={"data_coleta": "Data", "preco_atual": "Preço (R$)", "produto_nome": "Produto"},
-            markers=True
+            markers=True,
+            line_shape='hv'
         )
         fig_line.update_layout(
             hovermode='x unified',
@@ -392,6 +894,80 @@ def main():
     st.divider()
 
     # --- TABELA DE DADOS ---
+    show_detail_table(filtros, max_date)
+
+@st.fragment
+def show_alerts(filtros):
+    """
+    Alertas lidos de change_events (cada transição gravada pelo coletor), uma página por vez.
+    Como fragmento, trocar o tipo de alerta ou a página só reexecuta esta seção.
+    """
+    st.header("🚨 Alertas e Mudanças Importantes")
+
+    col_alert1, col_alert2 = st.columns([3, 1])
+    with col_alert1:
+        alerta = st.radio("Mostrar:", list(ALERTAS), horizontal=True)
+    with col_alert2:
+        pagina = st.number_input("Página:", min_value=1, value=1, step=1)
+
+    tipos, variacao_minima = ALERTAS[alerta]
+    df_eventos, total = load_change_events(filtros, tipos, pagina, variacao_minima)
+    if df_eventos is None:
+        show_history_alerts(filtros)
+        return
+    if total == 0:
+        st.info("Nenhum evento deste tipo no período selecionado.")
+        return
+    paginas = -(-total // ALERTAS_POR_PAGINA)
+    if df_eventos.empty:
+        st.info(f"Há {paginas} página(s) de eventos deste tipo no período selecionado.")
+        return
+
+    df_eventos['tipo'] = df_eventos['tipo'].map(NOMES_EVENTO)
+    st.dataframe(
+        df_eventos,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "data_coleta": st.column_config.DatetimeColumn("Data", format="DD/MM/YYYY HH:mm"),
+            "produto_nome": st.column_config.TextColumn("Produto", width="large"),
+            "sku": st.column_config.TextColumn("SKU", width="small"),
+            "categoria": st.column_config.TextColumn("Categoria", width="medium"),
+            "tipo": st.column_config.TextColumn("Evento", width="medium"),
+            "preco_anterior": st.column_config.NumberColumn("Preço Anterior", format="R$ %.2f"),
+            "preco_novo": st.column_config.NumberColumn("Preço Novo", format="R$ %.2f"),
+            "variacao_pct": st.column_config.NumberColumn("Variação", format="%+.1f%%")
+        }
+    )
+    st.caption(f"Página {pagina} de {paginas} ({total} eventos, mais recentes primeiro)")
+
+def show_history_alerts(filtros):
+    """Alertas do banco sem change_events: mudanças entre a primeira e a última coleta do período."""
+    availability_changes, significant_changes = history_alerts(filtros)
+    st.caption("Banco ainda sem eventos de mudança (change_events): os alertas comparam a primeira e a "
+               "última coleta do período até a próxima execução do coletor.")
+
+    # Mudanças de disponibilidade
+    if not availability_changes.empty:
+        st.subheader("📦 Mudanças de Disponibilidade")
+        st.dataframe(
+            availability_changes[['produto_nome', 'sku', 'status_anterior', 'status_atual', 'data_mudanca']],
+            use_container_width=True,
+            hide_index=True
+        )
+
+    # Produtos com variação significativa (>10% ou <-10%)
+    if not significant_changes.empty:
+        st.subheader("💰 Variações Significativas de Preço (>10%)")
+        st.dataframe(
+            significant_changes[['produto_nome', 'categoria', 'preco_inicial', 'preco_final', 'variacao_formatada']],
+            use_container_width=True,
+            hide_index=True
+        )
+
+@st.fragment
+def show_detail_table(filtros, max_date):
+    """Tabela detalhada. Como fragmento, mudar a visão ou o número de linhas só reexecuta esta seção."""
     st.subheader("📋 Dados Detalhados")
     
     # Opções de visualização
@@ -405,24 +981,7 @@ def main():
     with col_table2:
         num_rows = st.number_input("Linhas a exibir:", min_value=10, max_value=1000, value=50, step=10)
     
-    # Selecionar dados baseado na opção
-    if view_option == "Última Coleta (SKU Único)":
-        display_df = df_latest.copy()
-    else:
-        display_df = df_filtered.copy()
-    
-    # Formatar colunas para melhor visualização
-    display_df = display_df.sort_values(by="data_coleta", ascending=False).head(num_rows)
-    
-    # Selecionar colunas relevantes
-    columns_to_show = [
-        'data_coleta', 'produto_nome', 'sku', 'categoria', 
-        'preco_atual', 'preco_original', 'em_promocao', 'disponivel'
-    ]
-    
-    display_df_formatted = display_df[columns_to_show].copy()
-    display_df_formatted['em_promocao'] = display_df_formatted['em_promocao'].map({1: '✅', 0: '❌'})
-    display_df_formatted['disponivel'] = display_df_formatted['disponivel'].map({1: '✅', 0: '❌'})
+    display_df_formatted, total = detail_rows(filtros, max_date, view_option, num_rows)
     
     st.dataframe(
         display_df_formatted,
@@ -441,7 +1000,136 @@ def main():
     )
     
     # Estatísticas rápidas da tabela
-    st.caption(f"Exibindo {len(display_df_formatted)} de {len(display_df)} registros filtrados")
+    st.caption(f"Exibindo {len(display_df_formatted)} de {total} registros filtrados")
+
+@st.fragment
+def show_product_search():
+    """
+    Busca no índice FTS5 mantido pelo coletor e histórico do produto escolhido. Independe dos
+    filtros da sidebar; como fragmento, digitar ou escolher um produto só reexecuta esta seção.
+    """
+    texto = st.text_input(
+        "Buscar produto",
+        placeholder="Nome, tag, SKU ou categoria",
+        help="Sem diferença entre maiúsculas e acentos; o começo de cada palavra basta (ex.: 'colar pav')."
+    )
+    if not texto.strip():
+        return
+
+    resultados = search_products(texto)
+    if resultados is None:
+        st.warning("Índice de busca indisponível: ele é criado pelo coletor (app.py) na próxima execução.")
+        return
+    if resultados.empty:
+        st.info("Nenhum produto encontrado.")
+        return
+
+    posicao = st.selectbox(
+        f"Resultados ({len(resultados)} mais relevantes)",
+        range(len(resultados)),
+        format_func=lambda i: f"{resultados['produto_nome'].iloc[i]} — {resultados['sku'].iloc[i]} ({resultados['categoria'].iloc[i]})"
+    )
+    produto = resultados.iloc[posicao]
+    historico, eventos = load_product_history(int(produto['id']))
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Preço Atual", f"R$ {produto['preco_atual']:.2f}")
+    col2.metric("Disponível", "✅" if produto['disponivel'] == 1 else "❌")
+    col3.metric("Em Promoção", "✅" if produto['em_promocao'] == 1 else "❌")
+    col4.metric("Mudanças Registradas", max(len(historico) - 1, 0))
+
+    if len(historico) > 1:
+        fig_produto = px.line(
+            historico, x="data_coleta", y="preco_atual",
+            title=f"Histórico de Preços — {produto['produto_nome']}",
+            labels={"data_coleta": "Data", "preco_atual": "Preço (R$)"},
+            markers=True,
+            line_shape='hv'
+        )
+        st.plotly_chart(fig_produto, use_container_width=True)
+    st.caption(f"Última verificação: {produto['ultima_coleta']:%d/%m/%Y %H:%M}")
+
+    if not eventos.empty:
+        st.subheader("Eventos de Mudança")
+        st.dataframe(
+            eventos,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "data_coleta": st.column_config.DatetimeColumn("Data", format="DD/MM/YYYY HH:mm"),
+                "tipo": st.column_config.TextColumn("Evento", width="medium"),
+                "preco_anterior": st.column_config.NumberColumn("Preço Anterior", format="R$ %.2f"),
+                "preco_novo": st.column_config.NumberColumn("Preço Novo", format="R$ %.2f"),
+                "variacao_pct": st.column_config.NumberColumn("Variação", format="%+.1f%%")
+            }
+        )
+
+def show_run_metrics():
+    df_runs = load_run_metrics()
+    if df_runs.empty:
+        st.info("Nenhuma métrica de execução registrada ainda.")
+        return
+
+    ultima = df_runs.iloc[-1]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Duração da Última Execução", f"{ultima['duracao_s'] / 60:.1f} min")
+    col2.metric("Requisições", int(ultima['requisicoes']))
+    col3.metric("Taxa de Erro", f"{ultima['taxa_erro']:.1f}%")
+    col4.metric("Dados Recebidos", f"{ultima['bytes'] / 1e6:.1f} MB")
+
+    col_chart1, col_chart2 = st.columns(2)
+    with col_chart1:
+        st.subheader("Duração por Fase")
+        df_fases = df_runs.melt(
+            id_vars='data_coleta',
+            value_vars=['descoberta_s', 'coleta_s', 'escrita_s', 'duracao_s'],
+            var_name='fase', value_name='segundos'
+        )
+        df_fases['fase'] = df_fases['fase'].map({
+            'descoberta_s': 'Descoberta', 'coleta_s': 'Coleta', 'escrita_s': 'Escrita no banco', 'duracao_s': 'Total'
+        })
+        fig_fases = px.line(
+            df_fases, x='data_coleta', y='segundos', color='fase', markers=True,
+            labels={'data_coleta': 'Execução', 'segundos': 'Segundos', 'fase': 'Fase'}
+        )
+        st.plotly_chart(fig_fases, use_container_width=True)
+        st.caption("As fases se sobrepõem: a coleta começa durante a descoberta e inclui as gravações em lote.")
+
+    with col_chart2:
+        st.subheader("Taxa de Erro das Requisições")
+        fig_erro = px.line(
+            df_runs, x='data_coleta', y='taxa_erro', markers=True,
+            labels={'data_coleta': 'Execução', 'taxa_erro': 'Erros (%)'}
+        )
+        st.plotly_chart(fig_erro, use_container_width=True)
+
+    # Detalhes da última execução (guardados em JSON na coluna `detalhes`)
+    detalhes = json.loads(ultima['detalhes'])
+    col_chart3, col_chart4 = st.columns(2)
+    with col_chart3:
+        st.subheader("Latência das Requisições (Última Execução)")
+        limites = detalhes['latencia']['limites_s']
+        faixas = [f"≤ {limite}s" for limite in limites] + [f"> {limites[-1]}s"]
+        fig_lat = px.bar(
+            x=faixas, y=detalhes['latencia']['contagens'],
+            labels={'x': 'Latência', 'y': 'Requisições'}
+        )
+        st.plotly_chart(fig_lat, use_container_width=True)
+
+    with col_chart4:
+        st.subheader("Resultado por Produto (Última Execução)")
+        if detalhes['produtos']:
+            fig_metodos = px.pie(
+                names=list(detalhes['produtos'].keys()),
+                values=list(detalhes['produtos'].values()),
+                hole=0.4
+            )
+            st.plotly_chart(fig_metodos, use_container_width=True)
+        st.caption(
+            "Status HTTP: " + (", ".join(f"{status}: {n}" for status, n in detalhes['status'].items()) or "nenhum")
+            + (" | Exceções: " + ", ".join(f"{classe}: {n}" for classe, n in detalhes['excecoes'].items())
+               if detalhes['excecoes'] else "")
+        )
 
 if __name__ == "__main__":
     main()